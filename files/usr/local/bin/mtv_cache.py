@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# --------------------------------------------------------------------------
+# Mediathekview auf der Kommandozeile
+#
+# Class SuchCache: LRU-Cache für Suchergebnisse des Webservers
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/mtv_cli
+#
+# --------------------------------------------------------------------------
+
+import threading
+from collections import OrderedDict
+
+class SuchCache:
+  """LRU-Cache für Suchergebnisse (fertiges JSON einer Seite).
+     Der Schlüssel ist die normalisierte Suche (SQL-Text, Parameter und
+     Seite). Die Größe ist durch die Summe der Textlängen begrenzt, bei
+     Überschreitung fallen die am längsten nicht genutzten Einträge raus.
+     Ändert sich der Stand der Filmliste (Generation), wird der Cache
+     komplett geleert"""
+
+  # ------------------------------------------------------------------------
+
+  def __init__(self,max_size):
+    """Constructor. max_size ist die maximale Größe in Zeichen,
+       0 schaltet den Cache ab"""
+    self.max_size   = max_size
+    self.entries    = OrderedDict()
+    self.size       = 0
+    self.generation = None
+    self.hits       = 0
+    self.misses     = 0
+    self.lock       = threading.Lock()
+
+  # ------------------------------------------------------------------------
+
+  def set_generation(self,generation):
+    """Stand der Filmliste setzen, bei einer Änderung Cache leeren"""
+    with self.lock:
+      if generation != self.generation:
+        self.entries.clear()
+        self.size       = 0
+        self.generation = generation
+
+  # ------------------------------------------------------------------------
+
+  def get(self,key,statistik=True):
+    """Eintrag lesen, Ergebnis ist None falls nicht vorhanden. Mit
+       statistik=False zählt der Zugriff nicht für die Trefferquote
+       (Hilfseinträge wie die Anzahl Treffer einer Suche)"""
+    with self.lock:
+      value = self.entries.get(key)
+      if value is not None:
+        self.entries.move_to_end(key)
+      if statistik and value is None:
+        self.misses += 1
+      elif statistik:
+        self.hits += 1
+      return value
+
+  # ------------------------------------------------------------------------
+
+  def put(self,key,value,generation):
+    """Eintrag speichern. Ergebnisse eines veralteten Stands (generation)
+       und zu große Einträge werden nicht gespeichert"""
+    with self.lock:
+      if generation != self.generation or len(value) > self.max_size:
+        return
+      if key in self.entries:
+        self.size -= len(self.entries.pop(key))
+      self.entries[key] = value
+      self.size += len(value)
+      while self.size > self.max_size:
+        _,old = self.entries.popitem(last=False)
+        self.size -= len(old)
+
+  # ------------------------------------------------------------------------
+
+  def get_stats(self):
+    """Kennzahlen des Caches als dict zurückgeben"""
+    with self.lock:
+      return {"treffer":   self.hits,
+              "fehlend":   self.misses,
+              "eintraege": len(self.entries),
+              "groesse":   self.size}
@@ -13,8 +13,10 @@
 # --- System-Imports   -----------------------------------------------------
 
 from argparse import ArgumentParser
-import sys, os, re, lzma, random, fcntl
+import sys, os, re, lzma, random, json, time, datetime
 import urllib.request as request
+from urllib.error import HTTPError
+from urllib.parse import urlparse
 import ssl
 import configparser
 
@@ -23,7 +25,7 @@ from pick import pick
 # --- eigene Imports   ------------------------------------------------------
 
 from mtv_const    import (
-    BUFSIZE,
+    DIFF_STUNDE,
     DLL_FORMAT,
     DLL_TITEL,
     FILME_SQLITE,
@@ -31,10 +33,13 @@ from mtv_const    import (
     SEL_FORMAT,
     SEL_TITEL,
     URL_FILMLISTE,
+    URL_FILMLISTE_DIFF,
     VERSION,
 )
 from mtv_download import download_filme
 from mtv_filmdb   import FilmDB as FilmDB
+from mtv_ingest   import IngestStats, Pipeline
+from mtv_lock     import get_lock, release_lock
 from mtv_msg      import Msg as Msg
 
 # --- Hilfsklasse für Optionen   --------------------------------------------
@@ -42,11 +47,145 @@ from mtv_msg      import Msg as Msg
 class Options:
   pass
 
+UPDATE_MODI = ["voll","inkrementell"]
+
 # --- Stream der Filmliste   ------------------------------------------------
 
-def get_url_fp(url):
+def get_url_fp(url,headers={}):
   """ URL öffnen und Filepointer zurückgeben"""
-  return request.urlopen(url,context=ssl.create_default_context())
+  req = request.Request(url,headers=headers)
+  return request.urlopen(req,context=ssl.create_default_context())
+
+# --- Bedingter und fortsetzbarer Download der Filmliste   ------------------
+
+class ListDownload:
+  """Filmliste laden und dabei in eine lokale Datei schreiben.
+
+     Die Validatoren (ETag, Last-Modified, Größe) der zuletzt erfolgreich
+     importierten Liste stehen in der Status-Tabelle. Eine unveränderte
+     Liste wird nicht noch einmal geladen (bedingter GET). Ein abgebrochener
+     Download bleibt als .part-Datei liegen und wird beim nächsten Mal per
+     Range-Request fortgesetzt. Die Daten werden dabei wie ein Filepointer
+     gelesen, das Entpacken läuft also parallel zum Download."""
+
+  # ------------------------------------------------------------------------
+
+  def __init__(self,url,filmDB):
+    """Constructor"""
+    self.url      = url
+    self.filmDB   = filmDB
+    self.datei    = os.path.join(MTV_CLI_HOME,
+                                 os.path.basename(urlparse(url).path))
+    self.part     = self.datei + ".part"
+    self.response = None
+    self.cached   = None
+    self.part_fp  = None
+    self.validators = None
+    self.bytes    = 0
+
+  # ------------------------------------------------------------------------
+
+  def read_validators(self,prefix):
+    """Gespeicherte Validatoren lesen"""
+    rows = self.filmDB.read_status([prefix + self.url])
+    if rows and rows[0]['text']:
+      return json.loads(rows[0]['text'])
+    return None
+
+  # ------------------------------------------------------------------------
+
+  def open(self):
+    """Verbindung öffnen. Gibt False zurück, falls die Liste seit dem
+       letzten Import unverändert ist"""
+
+    headers = {}
+    offset  = os.path.getsize(self.part) if os.path.exists(self.part) else 0
+    part    = self.read_validators("_part:") if offset else None
+    if part and (part["etag"] or part["last_modified"]):
+      Msg.msg("INFO","Setze Download bei Byte %d fort" % offset)
+      headers["Range"]    = "bytes=%d-" % offset
+      headers["If-Range"] = part["etag"] or part["last_modified"]
+    else:
+      last = self.read_validators("_url:")
+      if last and last["etag"]:
+        headers["If-None-Match"] = last["etag"]
+      if last and last["last_modified"]:
+        headers["If-Modified-Since"] = last["last_modified"]
+
+    Msg.msg("DEBUG","HTTP-Header: %r" % headers)
+    try:
+      self.response = get_url_fp(self.url,headers)
+    except HTTPError as e:
+      if e.code == 304:
+        return False
+      elif e.code == 416 and offset:
+        # .part-Datei passt nicht zur Liste, neu laden
+        os.remove(self.part)
+        return self.open()
+      raise
+
+    if self.response.status == 206:
+      # vorhandenen Teil zuerst lesen, Rest anhängen
+      self.validators = part
+      self.cached     = open(self.part,"rb")
+      self.part_fp    = open(self.part,"ab")
+    else:
+      self.validators = {
+        "etag":          self.response.headers.get("ETag"),
+        "last_modified": self.response.headers.get("Last-Modified"),
+        "size":          self.response.headers.get("Content-Length")
+        }
+      self.part_fp = open(self.part,"wb")
+      self.filmDB.save_status("_part:" + self.url,json.dumps(self.validators))
+    return True
+
+  # ------------------------------------------------------------------------
+
+  def read(self,size=-1):
+    """Daten lesen (Schnittstelle eines Filepointers)"""
+
+    if self.cached:
+      data = self.cached.read(size)
+      if data:
+        return data
+      self.cached.close()
+      self.cached = None
+
+    data = self.response.read(size)
+    if data:
+      self.bytes += len(data)
+      self.part_fp.write(data)
+    elif self.part_fp:
+      # Download komplett
+      self.part_fp.close()
+      self.part_fp = None
+      if (self.validators["size"] and
+          os.path.getsize(self.part) != int(self.validators["size"])):
+        raise IOError("Download unvollständig")
+      os.replace(self.part,self.datei)
+    return data
+
+  # ------------------------------------------------------------------------
+
+  def readable(self):
+    return True
+
+  def seekable(self):
+    return False
+
+  # ------------------------------------------------------------------------
+
+  def commit(self):
+    """Validatoren nach erfolgreichem Import speichern"""
+    self.filmDB.save_status("_url:" + self.url,json.dumps(self.validators))
+
+  # ------------------------------------------------------------------------
+
+  def close(self):
+    """Verbindung und Dateien schließen"""
+    for fp in [self.cached,self.part_fp,self.response]:
+      if fp is not None:
+        fp.close()
 
 # --- Stream des LZMA-Entpackers   ------------------------------------------
 
@@ -56,84 +195,123 @@ def get_lzma_fp(url_fp):
 
 # --- Split der Datei   -----------------------------------------------------
 
-def split_content(fpin,filmDB):
+def split_content(fpin,filmDB,modus="voll",download=None):
   """Inhalt aufteilen"""
 
-  have_header=False
-  last_rec = ""
-
-  filmDB.create_filmtable()
-  filmDB.isolation_level = None
-  filmDB.cursor.execute("BEGIN;")
+  stats = IngestStats(download)
+  try:
+    filmDB.create_filmtable(modus)
+    filmDB.isolation_level = None
+    filmDB.cursor.execute("BEGIN;")
+
+    pipeline = Pipeline(fpin,filmDB,stats)
+    total    = pipeline.run()
+    Msg.msg("INFO","\n",False)
+
+    # Datensätze speichern und Datenbank schließen
+    start = time.perf_counter()
+    filmDB.commit()
+    filmDB.save_filmtable()
+    filmDB.save_status("_liste",pipeline.get_datum())
+    stats.add_time("speichern",start)
+    stats.status = "fertig"
+  except:
+    # offene Transaktion verwerfen, sonst blockiert sie save_status
+    stats.status = "Fehler"
+    filmDB.close()
+    raise
+  finally:
+    filmDB.save_status("_import",stats.as_json(filmDB))
 
-  total = 0
-  buf_count =  0
-  regex = re.compile(',\n? *"X" ?: ?')
-  while True:
-    # Buffer neu lesen
-    buffer = fpin.read(BUFSIZE)
-    buf_count = buf_count + 1
-    if not buf_count%100:
-      Msg.msg("INFO",'.',False)
-
-    # Verarbeitung Dateiende (verbliebenen Satz schreiben)
-    if len(buffer) == 0:
-      if len(last_rec):
-        total = total + 1
-        filmDB.insert_film(last_rec[0:-1])
-        break
-
-    # Sätze aufspalten
-    records = regex.split(last_rec+str(buffer))
-    Msg.msg("DEBUG","Anzahl Sätze: %d" % len(records))
-
-    # Sätze ausgeben. Der letzte Satz ist entweder leer,
-    # oder er ist eigentlich ein Satzanfang und wird aufgehoben
-    last_rec = records[-1]
-    for record in records[0:-1]:
-      Msg.msg("TRACE",record)
-      if not have_header:
-        have_header = True
-        continue
-      total = total + 1
-      filmDB.insert_film(record)
-
-  # Datensätze speichern und Datenbank schließen
-  filmDB.commit()
-  filmDB.save_filmtable()
-
-  Msg.msg("INFO","\n",False)
-  Msg.msg("INFO","Anzahl Buffer:              %d" % buf_count)
+  Msg.msg("INFO","Anzahl Buffer:              %d" % pipeline.get_buf_count())
   Msg.msg("INFO","Anzahl Sätze (gesamt):      %d" % total)
   Msg.msg("INFO","Anzahl Sätze (gespeichert): %d" % filmDB.get_count())
   Msg.msg("INFO","Anzahl Sätze (Dubletten):   %d" % filmDB.get_error())
 
+# --- Basis für die Diff-Liste prüfen   -------------------------------------
+
+def check_diff_basis(filmDB):
+  """Prüfen, ob die Diff-Liste auf die vorhandene Filmtabelle passt. Die
+     Diff-Liste enthält nur die Änderungen seit der Liste des Tages, die
+     Filmtabelle muss deshalb aus einer Liste von heute ab DIFF_STUNDE Uhr
+     stammen (wie bei MediathekView)"""
+
+  if not filmDB.has_filmtable():
+    Msg.msg("INFO","Keine Basisliste vorhanden, verwende komplette Liste")
+    return False
+  rows = filmDB.read_status(['_liste'])
+  if not rows or not rows[0]['text']:
+    Msg.msg("INFO","Alter der Basisliste unbekannt, verwende komplette Liste")
+    return False
+  datum  = datetime.datetime.fromisoformat(rows[0]['text']).astimezone()
+  grenze = datetime.datetime.now().replace(hour=DIFF_STUNDE,minute=0,
+                                           second=0,microsecond=0)
+  if datum < grenze.astimezone():
+    Msg.msg("INFO","Basisliste vom %s passt nicht zur Diff-Liste, "
+            "verwende komplette Liste" % datum.strftime("%d.%m.%Y %H:%M"))
+    return False
+  return True
+
 # --- Update verarbeiten   --------------------------------------------------
 
 def do_update(options):
-  """Update der Filmliste"""
+  """Update der Filmliste. Es läuft immer nur eine Aktualisierung, Suchen
+     und Downloads sind währenddessen weiter möglich"""
+
+  fd_lock = get_lock(options.dbfile,"aktualisieren",
+                     options.config["LOCK_TIMEOUT"])
+  if not fd_lock:
+    Msg.msg("ERROR","Aktualisierung der Datenbank %s läuft bereits" %
+            options.dbfile)
+    return False
+  try:
+    return _do_update(options)
+  finally:
+    release_lock(fd_lock)
+
+def _do_update(options):
+  """Update der Filmliste (ohne Sperre)"""
 
+  modus = "inkrementell" if options.upd_inkr else options.config["UPDATE_MODUS"]
   if options.upd_src == "auto":
     src = random.choice(URL_FILMLISTE)
+  elif options.upd_src == "diff":
+    # Diff-Liste nur mit passender Basisliste verwenden
+    if check_diff_basis(options.filmDB):
+      src   = random.choice(URL_FILMLISTE_DIFF)
+      modus = "diff"
+    else:
+      src = random.choice(URL_FILMLISTE)
   elif options.upd_src == "json":
     # existierende Filmliste verwenden
     src = os.path.join(MTV_CLI_HOME,"filme.json")
   else:
     src = options.upd_src
 
-  Msg.msg("INFO","Erzeuge %s aus %s" % (options.dbfile,src))
-  fpin = None
+  Msg.msg("INFO","Erzeuge %s aus %s (Modus: %s)" % (options.dbfile,src,modus))
+  fpin     = None
+  download = None
   try:
     if src.startswith("http"):
-      fpin = get_lzma_fp(get_url_fp(src))
+      download = ListDownload(src,options.filmDB)
+      if not download.open():
+        Msg.msg("INFO","Filmliste unverändert, keine Aktualisierung")
+        return True
+      fpin = get_lzma_fp(download)
     else:
       fpin = open(src,"r",encoding='utf-8')
-    split_content(fpin,options.filmDB)
+    split_content(fpin,options.filmDB,modus,download)
+    if download:
+      download.commit()
+    return True
   except Exception as e:
     Msg.msg("ERROR","Update der Filmliste gescheitert. Fehler: %s" % e)
+    return False
   finally:
     if fpin is not None:
       fpin.close()
+    if download is not None:
+      download.close()
 
 # --- Interaktiv Suchbegriffe festlegen   -----------------------------------
 
@@ -167,35 +345,35 @@ def get_suche():
 # --- Auswahlliste formatieren   --------------------------------------------
 
 def get_select(rows):
-  select_liste = []
+  """Zeilen der Auswahlliste einzeln liefern (Generator)"""
   for row in rows:
     sender=row['SENDER']
     thema=row['THEMA']
     titel=row['TITEL']
     datum=row['DATUM'].strftime("%d.%m.%y")
     dauer=row['DAUER']
-    select_liste.append(SEL_FORMAT.format(sender,thema,datum,dauer,titel))
-  return select_liste
+    yield SEL_FORMAT.format(sender,thema,datum,dauer,titel)
 
 # --- Filme suchen   --------------------------------------------------------
 
 def filme_suchen(options):
-  """Filme gemäß Vorgabe suchen"""
+  """Filme gemäß Vorgabe suchen. Die Treffer kommen als Generator,
+     große Ergebnismengen landen also nicht komplett im Speicher"""
   if not options.suche:
     options.suche = get_suche()
 
-  statement = options.filmDB.get_query(options.suche)
-  return options.filmDB.execute_query(statement)
+  statement,params = options.filmDB.get_query(options.suche,roh=True)
+  return options.filmDB.iter_query(statement,params)
 
 # --- Filme zur Auswahl anzeigen   ------------------------------------------
 
 def zeige_liste(rows):
   """ Filmliste anzeigen, Auswahl zurückgeben"""
-  return pick(get_select(rows), "  "+SEL_TITEL,multi_select=True)
+  return pick(list(get_select(rows)), "  "+SEL_TITEL,multi_select=True)
 
 # --- Ergebnisse für späteren Download speichern   --------------------------
 
-def save_selected(filmDB,rows,selected,status):
+def save_selected(filmDB,rows,selected,status,prio=0):
   """ Auswahl speichern """
 
   # Datenstruktuer erstellen
@@ -203,7 +381,7 @@ def save_selected(filmDB,rows,selected,status):
   for sel_text,sel_index in selected:
     row = rows[sel_index]
     inserts.append((row['_ID'],row['DATUM'],status))
-  return filmDB.save_downloads(inserts)
+  return filmDB.save_downloads(inserts,prio)
 
 # --- Filmliste anzeigen, Auswahl für späteren Download speichern    --------
 
@@ -218,14 +396,21 @@ def do_now(options):
 
   num_changes = _do_now_later_common_body(options, do_now=True)
   if num_changes > 0:
-    do_download(options)
+    return do_download(options)
+  return True
 
 
 def _do_now_later_common_body(options, do_now):
   save_selected_status, when_download_wording = (
     ("S", "Sofort-") if do_now else ("V", "Download")
   )
-  rows = filme_suchen(options)
+  if options.doBatch:
+    # alle Treffer vormerken, die Sätze werden dabei gestreamt und nur
+    # die benötigten Felder aufgehoben
+    rows = [{'_ID': row['_ID'], 'DATUM': row['DATUM']}
+            for row in filme_suchen(options)]
+  else:
+    rows = list(filme_suchen(options))
   if not rows:
     Msg.msg("INFO","Keine Suchtreffer")
     return 0
@@ -234,7 +419,8 @@ def _do_now_later_common_body(options, do_now):
     selected = [('dummy',i) for i in range(len(rows))]
   else:
     selected = zeige_liste(rows)
-  num_changes = save_selected(options.filmDB,rows,selected,save_selected_status)
+  num_changes = save_selected(options.filmDB,rows,selected,save_selected_status,
+                              options.prio or 0)
   Msg.msg("INFO","%d von %d Filme vorgemerkt für %sDownload" % (num_changes,len(selected),when_download_wording))
   return num_changes
 
@@ -243,41 +429,141 @@ def _do_now_later_common_body(options, do_now):
 
 def do_download(options):
   """Download vorgemerkter Filme"""
+  if options.fenster is not None:
+    options.config["DOWNLOAD_FENSTER"] = options.fenster
   if options.doNow:
     # Aufruf aus do_now
-    download_filme(options,status="'S'")
+    return download_filme(options,status="'S'")
   else:
-    download_filme(options)
+    return download_filme(options)
 
 # --- Suche ohne Download   -------------------------------------------------
 
 def do_search(options):
   """Suche ohne Download"""
 
-  rows = filme_suchen(options)
-  if rows:
-    if options.doBatch:
-      print("[")
-      for row in rows:
-        rdict = dict(row)
-        if 'Datum' in rdict:
-          rdict['Datum'] = rdict['Datum'].strftime("%d.%m.%y")
-        print(rdict,end='')
-        print(",")
+  # Treffer werden gestreamt, der Kopf kommt mit dem ersten Treffer
+  rows  = filme_suchen(options)
+  count = 0
+  if options.doBatch:
+    for row in rows:
+      if not count:
+        print("[")
+      rdict = dict(row)
+      if 'Datum' in rdict:
+        rdict['Datum'] = rdict['Datum'].strftime("%d.%m.%y")
+      print(rdict,end='')
+      print(",")
+      count += 1
+    if count:
       print("]")
-    else:
-      print(SEL_TITEL)
-      print(len(SEL_TITEL)*'_')
-      for row in get_select(rows):
-        print(row)
-    return True
   else:
+    for line in get_select(rows):
+      if not count:
+        print(SEL_TITEL)
+        print(len(SEL_TITEL)*'_')
+      print(line)
+      count += 1
+  return count > 0
+
+# --- Suche analysieren   ---------------------------------------------------
+
+def do_explain(options):
+  """Suche ausführen und statt der Treffer Statement, Ausführungsplan,
+     Zähler und Laufzeit ausgeben"""
+
+  if not options.suche:
+    options.suche = get_suche()
+  statement,params = options.filmDB.get_query(options.suche,roh=True)
+  result = options.filmDB.explain_query(statement,params)
+
+  print("SQL:        %s" % " ".join(result["sql"].split()))
+  print("Parameter:  %r" % (result["params"],))
+  print("Plan:")
+  for line in result["plan"]:
+    print("  %s" % line)
+  print("Treffer:    %d" % result["rows"])
+  stats = result["stats"]
+  if stats:
+    print("Scan:       %d Sätze (Tabellen-Scan ohne Index)" % stats["scan"])
+    print("Sortierung: %d, Auto-Index: %d, VM-Schritte: %d" %
+          (stats["sort"],stats["autoindex"],stats["vm"]))
+  print("Laufzeit:   %.3f s" % result["zeit"])
+  return result["rows"] > 0
+
+# --- Abos verwalten   -----------------------------------------------------
+
+def do_abo(options):
+  """Suchausdruck als Abo speichern (mit -V werden Treffer automatisch
+     vorgemerkt)"""
+
+  if not options.suche:
+    options.suche = get_suche()
+  if not options.filmDB.save_abo(options.abo_name,options.suche,
+                                 options.doLater):
+    Msg.msg("ERROR","Suchausdruck für Abo nicht verwendbar")
+    return False
+  Msg.msg("INFO","Abo %s gespeichert" % options.abo_name)
+  return True
+
+def do_abo_loeschen(options):
+  """Abo samt Treffern löschen"""
+
+  if not options.filmDB.delete_abo(options.abo_loeschen):
+    Msg.msg("ERROR","Abo %s existiert nicht" % options.abo_loeschen)
     return False
+  Msg.msg("INFO","Abo %s gelöscht" % options.abo_loeschen)
+  return True
+
+def do_abos(options):
+  """Abos auflisten"""
+
+  rows = options.filmDB.read_abos()
+  for row in rows:
+    print("%-15s %s%s (Treffer: %d, neu: %d)" %
+          (row['name']," ".join(json.loads(row['suche'])),
+           " [vormerken]" if row['vormerken'] else "",
+           row['treffer'],row['neu']))
+  return len(rows) > 0
+
+# --- Neue Treffer der Abos anzeigen   --------------------------------------
+
+def do_treffer(options):
+  """Noch nicht gemeldete Treffer der Abos ausgeben und als gemeldet
+     markieren"""
+
+  name = options.treffer or None
+  rows = options.filmDB.read_treffer(name,neu=True)
+  if not rows:
+    return False
+  if options.doBatch:
+    print("[")
+    for row in rows:
+      rdict = dict(row)
+      rdict['Datum']    = rdict['Datum'].strftime("%d.%m.%y")
+      rdict['gefunden'] = rdict['gefunden'].strftime("%d.%m.%y %H:%M")
+      print(rdict,end='')
+      print(",")
+    print("]")
+  else:
+    abo = None
+    for row,line in zip(rows,get_select(rows)):
+      if row['abo'] != abo:
+        if abo:
+          print()
+        abo = row['abo']
+        print("Abo: %s" % abo)
+        print(SEL_TITEL)
+        print(len(SEL_TITEL)*'_')
+      print(line)
+  options.filmDB.mark_treffer([(row['abo'],row['_id']) for row in rows])
+  return True
 
 # --- Downloadliste anzeigen und editieren   --------------------------------
 
 def do_edit(options):
-  """Downloadliste anzeigen und editieren"""
+  """Downloadliste anzeigen und editieren. Die Auswahl wird gelöscht,
+     mit --prio bekommt sie stattdessen die neue Priorität"""
 
   # Liste lesen
   rows = options.filmDB.read_downloads()
@@ -300,11 +586,15 @@ def do_edit(options):
                                           sender,thema,datum,dauer,titel))
   selected = pick(select_liste, DLL_TITEL,multi_select=True)
 
-  # IDs extrahieren und Daten löschen
+  # IDs extrahieren und Daten löschen bzw. Priorität ändern
   deletes = []
   for sel_text,sel_index in selected:
     row = rows[sel_index]
     deletes.append((row['_ID'],))
+  if options.prio is not None:
+    changes = options.filmDB.update_prio(deletes,options.prio)
+    Msg.msg("INFO","Priorität von %d vorgemerkten Filmen geändert" % changes)
+    return
   if len(deletes):
     changes = options.filmDB.delete_downloads(deletes)
   else:
@@ -320,7 +610,10 @@ def get_parser():
 
   parser.add_argument('-A', '--akt', metavar='Quelle',
     dest='upd_src', nargs="?", default=None, const="auto",
-    help='Filmliste aktualisieren (Quelle: auto|json|Url|Datei)')
+    help='Filmliste aktualisieren (Quelle: auto|diff|json|Url|Datei)')
+  parser.add_argument('-i', '--inkrementell', action='store_true',
+    dest='upd_inkr',
+    help='Filmliste inkrementell aktualisieren (zusammen mit -A)')
   parser.add_argument('-V', '--vormerken', action='store_true',
     dest='doLater',
     help='Filmauswahl im Vormerk-Modus')
@@ -337,6 +630,29 @@ def get_parser():
   parser.add_argument('-Q', '--query', action='store_true',
     dest='doSearch',
     help='Filme suchen')
+  parser.add_argument('--prio', metavar='Wert', type=int,
+    dest='prio', default=None,
+    help='Priorität beim Vormerken (mit -V, -S) bzw. neue Priorität (mit -E)')
+  parser.add_argument('--fenster', metavar='Minuten', type=int,
+    dest='fenster', default=None,
+    help='Keine neuen Downloads nach Ablauf der Minuten starten (mit -D)')
+
+  parser.add_argument('--explain', action='store_true',
+    dest='doExplain',
+    help='Statement, Ausführungsplan und Laufzeit der Suche ausgeben (zusammen mit -Q)')
+
+  parser.add_argument('--abo', metavar='Name',
+    dest='abo_name', default=None,
+    help='Suchausdruck als Abo speichern (mit -V: Treffer automatisch vormerken)')
+  parser.add_argument('--abo-loeschen', metavar='Name',
+    dest='abo_loeschen', default=None,
+    help='Abo löschen')
+  parser.add_argument('--abos', action='store_true',
+    dest='doAbos',
+    help='Abos auflisten')
+  parser.add_argument('--treffer', metavar='Name',
+    dest='treffer', nargs="?", default=None, const="",
+    help='Neue Treffer (aller Abos oder des angegebenen Abos) ausgeben')
 
   parser.add_argument('-b', '--batch', action='store_true',
     dest='doBatch',
@@ -361,33 +677,47 @@ def get_parser():
     help='Suchausdruck')
   return parser
 
-# --- Lock anfordern  -------------------------------------------------------
-
-def get_lock(datei):
-  global fd_datei
-
-  if not os.path.isfile(datei):
-    return True
-
-  fd_datei = open(datei,"r")
-  try:
-    lock = fcntl.flock(fd_datei,fcntl.LOCK_NB | fcntl.LOCK_EX)
-    return True
-  except IOError:
-    return False
-
 # --- Konfigurationsobjekt erzeugen   ---------------------------------------
 
 def get_config(parser):
+  if parser.has_section('FILTER'):
+    filter_rules = {key.upper(): value for key,value in parser.items('FILTER')}
+  else:
+    filter_rules = {}
+
+  update_modus = parser.get('CONFIG',"UPDATE_MODUS",fallback="voll")
+  if update_modus not in UPDATE_MODI:
+    raise ValueError("UPDATE_MODUS muss %s sein, nicht %s" %
+                     (" oder ".join(UPDATE_MODI),update_modus))
+
   return {
     "MSG_LEVEL":         parser.get('CONFIG',"MSG_LEVEL"),
     "DATE_CUTOFF":       parser.getint('CONFIG',"DATE_CUTOFF"),
     "DAUER_CUTOFF":      parser.getint('CONFIG',"DAUER_CUTOFF"),
+    "UPDATE_MODUS":      update_modus,
+    "INSERT_BATCH":      parser.getint('CONFIG',"INSERT_BATCH",fallback=1000),
+    "NUM_WORKERS":       parser.getint('CONFIG',"NUM_WORKERS",fallback=0),
+    "DB_CACHE_SIZE":     parser.getint('CONFIG',"DB_CACHE_SIZE",fallback=8),
+    "DB_MMAP_SIZE":      parser.getint('CONFIG',"DB_MMAP_SIZE",fallback=64),
+    "LOCK_TIMEOUT":      parser.getint('CONFIG',"LOCK_TIMEOUT",fallback=30),
     "NUM_DOWNLOADS":     parser.getint('CONFIG',"NUM_DOWNLOADS"),
+    "NUM_DOWNLOADS_HOST": parser.getint('CONFIG',"NUM_DOWNLOADS_HOST",
+                                        fallback=0),
+    "DOWNLOAD_RATE":     parser.getint('CONFIG',"DOWNLOAD_RATE",fallback=0),
+    "DOWNLOAD_REIHENFOLGE": parser.get('CONFIG',"DOWNLOAD_REIHENFOLGE",
+                                       fallback="prio"),
+    "DOWNLOAD_FENSTER":  parser.getint('CONFIG',"DOWNLOAD_FENSTER",fallback=0),
     "ZIEL_DOWNLOADS":    parser.get('CONFIG',"ZIEL_DOWNLOADS"),
     "CMD_DOWNLOADS":     parser.get('CONFIG',"CMD_DOWNLOADS"),
     "CMD_DOWNLOADS_M3U": parser.get('CONFIG',"CMD_DOWNLOADS_M3U"),
-    "QUALITAET":         parser.get('CONFIG',"QUALITAET")
+    "QUALITAET":         parser.get('CONFIG',"QUALITAET"),
+    "DOWNLOAD_ENGINE":   parser.get('CONFIG',"DOWNLOAD_ENGINE",fallback="extern"),
+    "DOWNLOAD_TIMEOUT":  parser.getint('CONFIG',"DOWNLOAD_TIMEOUT",fallback=60),
+    "DOWNLOAD_RETRIES":  parser.getint('CONFIG',"DOWNLOAD_RETRIES",fallback=3),
+    "HLS_PARALLEL":      parser.getint('CONFIG',"HLS_PARALLEL",fallback=4),
+    "DOWNLOAD_FORTSCHRITT": parser.getint('CONFIG',"DOWNLOAD_FORTSCHRITT",
+                                          fallback=5),
+    "FILTER":            filter_rules
     }
 
 # --- Hauptprogramm   -------------------------------------------------------
@@ -400,7 +730,7 @@ if __name__ == '__main__':
     config = get_config(config_parser)
   except Exception as e:
     print("Konfiguration fehlerhaft!")
-    print("Fehler: %s" % e.message)
+    print("Fehler: %s" % e)
     sys.exit(3)
 
   opt_parser = get_parser()
@@ -423,29 +753,36 @@ if __name__ == '__main__':
     Msg.msg("ERROR","Datenbank %s existiert nicht!" % options.dbfile)
     sys.exit(3)
 
-  # Lock anfordern
-  if not get_lock(options.dbfile):
-    Msg.msg("ERROR","Datenbank %s ist gesperrt" % options.dbfile)
-    sys.exit(3)
-
   # Globale Objekte anlegen
   options.config = config
   options.filmDB = FilmDB(options)
 
-  if options.upd_src:
-    do_update(options)
-  elif options.doEdit:
-    do_edit(options)
-  elif options.doLater:
-    do_later(options)
-  elif options.doNow:
-    do_now(options)
-  elif options.doDownload:
-    do_download(options)
-  elif options.doSearch:
-    if do_search(options):
-      sys.exit(0)
-    else:
-      sys.exit(1)
-  sys.exit(0)
+  rc = 0
+  try:
+    # Aktualisierung und Download sperren selbst (nur gegen sich selbst)
+    if options.upd_src:
+      rc = 0 if do_update(options) else 3
+    elif options.abo_name:
+      rc = 0 if do_abo(options) else 3
+    elif options.abo_loeschen:
+      rc = 0 if do_abo_loeschen(options) else 3
+    elif options.doAbos:
+      rc = 0 if do_abos(options) else 1
+    elif options.treffer is not None:
+      rc = 0 if do_treffer(options) else 1
+    elif options.doEdit:
+      do_edit(options)
+    elif options.doLater:
+      do_later(options)
+    elif options.doNow:
+      rc = 0 if do_now(options) else 3
+    elif options.doDownload:
+      rc = 0 if do_download(options) else 3
+    elif options.doSearch and options.doExplain:
+      rc = 0 if do_explain(options) else 1
+    elif options.doSearch:
+      rc = 0 if do_search(options) else 1
+  finally:
+    options.filmDB.shutdown()
+  sys.exit(rc)
 
@@ -15,7 +15,12 @@ import os
 
 VERSION=2      # Erhöhung nur bei inkompatiblen Änderungen
 
-BUFSIZE=8192
+BUFSIZE=1048576
+INGEST_CHUNK=2000   # Sätze pro Block beim Import
+INGEST_QUEUE=4      # max. Anzahl Blöcke zwischen den Stufen
+STATS_INTERVAL=5    # Sekunden zwischen zwei Sicherungen der Kennzahlen
+FETCH_SIZE=500      # Sätze pro Block beim Lesen von Suchergebnissen
+DIFF_STUNDE=6       # Diff-Liste nur zu einer Basisliste von heute ab 6 Uhr
 
 # --- Titel   ---------------------------------------------------------------
 
@@ -34,3 +39,4 @@ MTV_CLI_SQLITE=os.path.join(MTV_CLI_HOME,"mtv_cli.sqlite")
 # --- Download-URLs   --------------------------------------------------------
 
 URL_FILMLISTE=["https://liste.mediathekview.de/Filmliste-akt.xz"]
+URL_FILMLISTE_DIFF=["https://liste.mediathekview.de/Filmliste-diff.xz"]
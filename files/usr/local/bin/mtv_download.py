@@ -17,17 +17,82 @@
 import os
 import subprocess
 import shlex
+import threading
+import time
 from subprocess import DEVNULL,STDOUT
-from multiprocessing.pool import ThreadPool
+from urllib.parse import urlsplit
 
 # --- eigene Imports   ------------------------------------------------------
 
+from mtv_hls    import HlsDownload
+from mtv_http   import HttpDownload
+from mtv_lock   import get_lock, release_lock
 from mtv_msg    import Msg as Msg
 
+# --- Fortschritt eines Downloads   ----------------------------------------
+
+class Fortschritt:
+  """Fortschritt eines Downloads (geladene Bytes, erwartete Größe, Rate und
+     Restzeit). In der Datenbank landet der Stand höchstens alle intervall
+     Sekunden, mit intervall 0 nur der Stand bei Start und Ende"""
+
+  # ------------------------------------------------------------------------
+
+  def __init__(self,filmDB,_id,geladen=0,erwartet=None,intervall=5):
+    """Constructor. geladen ist der Stand beim Start (Fortsetzung)"""
+    self.filmDB    = filmDB
+    self._id       = _id
+    self.erwartet  = erwartet
+    self.intervall = intervall
+    self.start     = (time.monotonic(),geladen)
+    self.stand     = self.start         # (Zeit,Bytes) der letzten Messung
+    self.rate      = None
+    filmDB.update_fortschritt(_id,geladen,erwartet,None,None)
+
+  # ------------------------------------------------------------------------
+
+  def update(self,geladen,erwartet=None):
+    """Neuen Stand melden (Bytes in der Zieldatei)"""
+
+    if not self.intervall:
+      return
+    now = time.monotonic()
+    if geladen < self.stand[1]:
+      # Datei wurde neu begonnen oder gekürzt
+      self.start = self.stand = (now,geladen)
+      return
+    if now - self.stand[0] < self.intervall:
+      return
+    rate = (geladen - self.stand[1])/(now - self.stand[0])
+    self.rate     = rate if self.rate is None else (self.rate + rate)/2
+    self.stand    = (now,geladen)
+    self.erwartet = erwartet or self.erwartet
+    if self.erwartet and self.rate > 0:
+      eta = int(max(0,self.erwartet - geladen)/self.rate)
+    else:
+      eta = None
+    self.filmDB.update_fortschritt(self._id,geladen,self.erwartet,
+                                   int(self.rate),eta)
+
+  # ------------------------------------------------------------------------
+
+  def ende(self,ziel,ok):
+    """Endstand speichern, die Rate ist dann der Durchschnitt"""
+
+    geladen = os.path.getsize(ziel) if os.path.exists(ziel) else 0
+    dauer   = time.monotonic() - self.start[0]
+    rate    = int((geladen - self.start[1])/dauer) if dauer > 0 else None
+    if ok:
+      self.filmDB.update_fortschritt(self._id,geladen,geladen,rate,0)
+    else:
+      self.filmDB.update_fortschritt(self._id,geladen,self.erwartet,rate,None)
+
 # --- Download eines Films   -----------------------------------------------
 
-def download_film(options,film):
-  """Download eines einzelnen Films"""
+def download_film(options,film,loader=None):
+  """Download eines einzelnen Films. Mit loader (HttpDownload) lädt das
+     Programm selbst (Playlisten per HlsDownload), sonst per Kommando
+     (CMD_DOWNLOADS bzw. CMD_DOWNLOADS_M3U)"""
 
   # Infos zusammensuchen
   _id = film._id
@@ -54,17 +119,47 @@ def download_film(options,film):
   if not os.path.exists(ziel_dir):
     os.mkdir(ziel_dir)
 
+  # erwartete Größe: Angabe der Filmliste in MB (ohne Playlisten), der
+  # interne Download ersetzt sie durch die Angabe des Servers
+  if isinstance(film.groesse,int) and film.groesse > 0 and not isM3U:
+    erwartet = film.groesse*1024*1024
+  else:
+    erwartet = None
+
   # Download ausführen
   options.filmDB.update_downloads(_id,'A')
+  fortschritt = Fortschritt(options.filmDB,_id,
+                      os.path.getsize(ziel) if os.path.exists(ziel) else 0,
+                      erwartet,options.config["DOWNLOAD_FORTSCHRITT"])
   Msg.msg("INFO","Start Download (%s) %s" % (size,film.titel[0:50]))
-  if isM3U:
+  if loader and isM3U:
+    Msg.msg("DEBUG","HLS-Download intern: %s" % url)
+    p = None
+    hls = HlsDownload(loader,options.config["QUALITAET"],
+                      options.config["HLS_PARALLEL"])
+    rc = 0 if hls.download(url,ziel,fortschritt.update) else 1
+  elif loader:
+    Msg.msg("DEBUG","Download intern: %s" % url)
+    p = None
+    rc = 0 if loader.download(url,ziel,fortschritt.update) else 1
+  elif isM3U:
     Msg.msg("DEBUG","Kommando: %s" % cmd)
     p = subprocess.Popen(cmd,shell=True,stdout=DEVNULL, stderr=STDOUT)
   else:
     Msg.msg("DEBUG","Kommando: %r" % shlex.split(cmd))
     p = subprocess.Popen(shlex.split(cmd),stdout=DEVNULL, stderr=STDOUT)
-  p.wait()
-  rc = p.returncode
+  if p:
+    # externes Kommando: Fortschritt an der Größe der Zieldatei messen
+    # (ohne Intervall nur auf das Ende warten)
+    while True:
+      try:
+        p.wait(timeout=fortschritt.intervall or None)
+        break
+      except subprocess.TimeoutExpired:
+        if os.path.exists(ziel):
+          fortschritt.update(os.path.getsize(ziel))
+    rc = p.returncode
+  fortschritt.ende(ziel,rc==0)
   Msg.msg("INFO",
       "Ende  Download (%s) %s (Return-Code: %d)" % (size,film.titel[0:50],rc))
   if rc==0:
@@ -75,25 +170,109 @@ def download_film(options,film):
 
   return rc
 
+# --- Zeitfenster prüfen   -------------------------------------------------
+
+def fenster_abgelaufen(ende,rest):
+  """Prüfen, ob das Zeitfenster (ende) für neue Downloads abgelaufen ist"""
+
+  if ende and time.time() >= ende:
+    Msg.msg("INFO","Zeitfenster abgelaufen, %d Filme bleiben vorgemerkt" % rest)
+    return True
+  return False
+
+# --- Downloads verteilen   ------------------------------------------------
+
+def run_downloads(options,filme,loader=None,ende=None):
+  """Filme mit höchstens NUM_DOWNLOADS parallelen Downloads laden, davon
+     höchstens NUM_DOWNLOADS_HOST pro Server. Ein freier Platz geht an den
+     nächsten Film (in der Reihenfolge der Liste) des Servers mit den
+     wenigsten laufenden Downloads, damit die Last über die Server verteilt
+     wird. Nach dem Zeitpunkt ende starten keine neuen Downloads mehr"""
+
+  slots    = options.config["NUM_DOWNLOADS"]
+  per_host = options.config["NUM_DOWNLOADS_HOST"] or slots
+  wartend  = [(urlsplit(film.get_url(options.config["QUALITAET"])[1]).hostname,
+               film) for film in filme]
+  aktiv    = {}                         # Server -> laufende Downloads
+  cond     = threading.Condition()
+
+  def worker(host,film):
+    try:
+      download_film(options,film,loader)
+    except Exception as ex:
+      Msg.msg("ERROR","Download %s fehlgeschlagen: %s" % (film._id,ex))
+    finally:
+      with cond:
+        aktiv[host] -= 1
+        cond.notify()
+
+  threads = []
+  with cond:
+    while wartend:
+      if fenster_abgelaufen(ende,len(wartend)):
+        break
+      frei = [(aktiv.get(host,0),i) for i,(host,_) in enumerate(wartend)
+                                    if aktiv.get(host,0) < per_host]
+      if not frei or sum(aktiv.values()) >= slots:
+        cond.wait(max(0,ende - time.time()) if ende else None)
+        continue
+      host,film   = wartend.pop(min(frei)[1])
+      aktiv[host] = aktiv.get(host,0) + 1
+      Msg.msg("DEBUG","Download %s über %s (%d aktiv)" %
+              (film._id,host,aktiv[host]))
+      thread = threading.Thread(target=worker,args=(host,film))
+      thread.start()
+      threads.append(thread)
+  for thread in threads:
+    thread.join()
+
 # --- Download aller Filme   -----------------------------------------------
 
 def download_filme(options,status="'V','F','A'"):
-  # Filme lesen
-  filme = options.filmDB.read_downloads(ui=False,status=status)
+  """Vorgemerkte Filme herunterladen. Es läuft immer nur ein Download-Lauf
+     (Suchen und Aktualisierung sind währenddessen weiter möglich).
+     Die Reihenfolge bestimmt DOWNLOAD_REIHENFOLGE, nach Ablauf von
+     DOWNLOAD_FENSTER Minuten startet kein neuer Download mehr.
+     Ergebnis ist False, falls schon ein anderer Lauf aktiv ist"""
 
-  if not filme:
-    Msg.msg("INFO","Keine vorgemerkten Filme vorhanden")
-    return
+  fd_lock = get_lock(options.dbfile,"download",options.config["LOCK_TIMEOUT"])
+  if not fd_lock:
+    Msg.msg("ERROR","Download für Datenbank %s läuft bereits" % options.dbfile)
+    return False
 
-  if options.config["NUM_DOWNLOADS"] == 1:
-    # Spezialbehandlung (erleichtert Debugging)
-    for film in filme:
-      download_film(options,film)
-  else:
-    with ThreadPool(options.config["NUM_DOWNLOADS"]) as pool:
-      for film in filme:
-        pool.apply_async(download_film,(options,film))
-      pool.close()
-      pool.join()
+  try:
+    # Filme in der Reihenfolge für den Download lesen
+    fenster = options.config["DOWNLOAD_FENSTER"]
+    ende    = time.time() + 60*fenster if fenster else None
+    filme   = options.filmDB.read_downloads(ui=False,status=status,
+                        reihenfolge=options.config["DOWNLOAD_REIHENFOLGE"])
+
+    if not filme:
+      Msg.msg("INFO","Keine vorgemerkten Filme vorhanden")
+      return True
+
+    # interner Download: Verbindungen werden über alle Filme geteilt
+    if options.config["DOWNLOAD_ENGINE"] == "intern":
+      loader = HttpDownload(options.config["DOWNLOAD_TIMEOUT"],
+                            options.config["DOWNLOAD_RETRIES"],
+                            1024*options.config["DOWNLOAD_RATE"])
+    else:
+      loader = None
+      if options.config["DOWNLOAD_RATE"]:
+        Msg.msg("WARN","DOWNLOAD_RATE gilt nur für DOWNLOAD_ENGINE intern")
+
+    if options.config["NUM_DOWNLOADS"] == 1:
+      # Spezialbehandlung (erleichtert Debugging)
+      for i,film in enumerate(filme):
+        if fenster_abgelaufen(ende,len(filme)-i):
+          break
+        download_film(options,film,loader)
+    else:
+      run_downloads(options,filme,loader,ende)
+    if loader:
+      loader.close()
 
-  options.filmDB.save_status('_download')
+    options.filmDB.save_status('_download')
+    return True
+  finally:
+    release_lock(fd_lock)
@@ -12,10 +12,13 @@
 #
 # --------------------------------------------------------------------------
 
-import sqlite3, json, datetime
+import os, sqlite3, json, time, datetime, threading
 from multiprocessing import Lock
 
-from mtv_filminfo import FilmInfo
+from mtv_const    import FETCH_SIZE
+from mtv_filminfo import FilmInfo, fold
+from mtv_filter   import FilmFilter
+from mtv_query    import FilmQuery
 from mtv_msg      import Msg as Msg
 
 # --- FilmDB: Datenbank aller Filme   --------------------------------------
@@ -23,6 +26,138 @@ from mtv_msg      import Msg as Msg
 class FilmDB:
   """Datenbank aller Filme"""
 
+  COLUMNS = ["Sender","Thema","Titel","Datum","Zeit","Dauer","Groesse",
+             "Beschreibung","Url","Website","Url_Untertitel","Url_RTMP",
+             "Url_Klein","Url_RTMP_Klein","Url_HD","Url_RTMP_HD","DatumL",
+             "Url_History","Geo","neu","_id"]
+
+  CREATE_STMT = """CREATE %s TABLE %s
+      (Sender text,
+      Thema text,
+      Titel text,
+      Datum date,
+      Zeit text,
+      Dauer text,
+      Groesse integer,
+      Beschreibung text,
+      Url text,
+      Website text,
+      Url_Untertitel text,
+      Url_RTMP text,
+      Url_Klein text,
+      Url_RTMP_Klein text,
+      Url_HD text,
+      Url_RTMP_HD text,
+      DatumL text,
+      Url_History text,
+      Geo text,
+      neu text,
+      _id text unique,
+      Sender_n text,
+      Thema_n text,
+      Titel_n text,
+      _nr integer primary key )"""
+
+  # Spalten mit normalisierter Kopie (Suffix _n) für indizierte Suchen
+  FOLD_COLUMNS = ["Sender","Thema","Titel"]
+  SELECT_COLUMNS = ",".join(COLUMNS)
+
+  # _nr (rowid) vergibt SQLite, sie ist als Primärschlüssel auch nach einem
+  # VACUUM stabil (der Volltextindex verweist darauf)
+  ROW_COLUMNS = ",".join(COLUMNS + [c+"_n" for c in FOLD_COLUMNS])
+  INSERT_STMT = 'INSERT OR IGNORE INTO %%s (%s) VALUES (%s)' % (
+                                              ROW_COLUMNS,",".join(24*"?"))
+
+  STATUS_CREATE   = """CREATE TABLE IF NOT EXISTS status (
+                       key          text primary key,
+                       Zeit         timestamp,
+                       text         text)"""
+  STATUS_INSERT   = """INSERT OR REPLACE INTO status Values (?,?,?)"""
+  DOWNLOADS_CREATE = """CREATE TABLE IF NOT EXISTS downloads (
+                       _id          text primary key,
+                       Datum        date,
+                       status       text,
+                       DatumStatus  date,
+                       prio         integer default 0,
+                       geladen      integer,
+                       erwartet     integer,
+                       rate         integer,
+                       eta          integer,
+                       ZeitFortschritt timestamp)"""
+  # später ergänzte Spalten der Tabelle downloads (für bestehende Datenbanken)
+  DOWNLOADS_EXTRA = [("prio","integer default 0"),
+                     ("geladen","integer"),("erwartet","integer"),
+                     ("rate","integer"),("eta","integer"),
+                     ("ZeitFortschritt","timestamp")]
+  DOWNLOADS_INSERT = """INSERT OR IGNORE INTO downloads
+                          (_id,Datum,status,DatumStatus,prio)
+                          VALUES (?,?,?,?,?)"""
+  # Kriterien für die Reihenfolge der Downloads (DOWNLOAD_REIHENFOLGE)
+  DOWNLOADS_ORDER = {"prio":    "d.prio DESC",         # höchste zuerst
+                     "groesse": "f.Groesse",           # kleinste zuerst
+                     "dauer":   "f.Dauer",             # kürzeste zuerst
+                     "datum":   "f.Datum"}             # älteste zuerst
+  RECS_CREATE     = """CREATE TABLE IF NOT EXISTS recordings (
+                       Sender       text,
+                       Titel        text,
+                       Beschreibung text,
+                       DatumFilm    date,
+                       Dateiname    text primary key,
+                       DatumDatei   date)"""
+  ABOS_CREATE     = """CREATE TABLE IF NOT EXISTS abos (
+                       name         text primary key,
+                       suche        text,
+                       vormerken    integer,
+                       angelegt     timestamp)"""
+  TREFFER_CREATE  = """CREATE TABLE IF NOT EXISTS abo_treffer (
+                       name         text,
+                       _id          text,
+                       gefunden     timestamp,
+                       gemeldet     integer,
+                       primary key (name,_id))"""
+  # Anzahl Filme pro Sender, Sender+Thema und Tag (bei jeder
+  # Aktualisierung neu berechnet)
+  FACETTEN_CREATE = ["""CREATE TABLE IF NOT EXISTS facetten_sender (
+                       Sender       text primary key,
+                       anzahl       integer)""",
+                     """CREATE TABLE IF NOT EXISTS facetten_thema (
+                       Sender       text,
+                       Thema        text,
+                       anzahl       integer,
+                       primary key (Sender,Thema))""",
+                     """CREATE TABLE IF NOT EXISTS facetten_datum (
+                       Datum        date primary key,
+                       anzahl       integer)"""]
+  INGEST_PRAGMAS  = ["cache_size=-65536"]                 # 64 MB
+  REBUILD_PRAGMAS = ["synchronous=OFF"]                   # nur Neuaufbau
+
+  INDEXES = {"id_index":     "_id",
+             "sender_index": "Sender_n",
+             "thema_index":  "Thema_n",
+             "titel_index":  "Titel_n"}
+
+  # Volltextindex: Umlaute/Akzente werden gefaltet (ä=a), der Index speichert
+  # nur Verweise (rowid) auf die Tabelle Filme und keine Kopie der Texte
+  FTS_COLUMNS = "Sender,Thema,Titel,Beschreibung"
+  FTS_CREATE  = """CREATE VIRTUAL TABLE %s USING fts5(
+                   Sender,Thema,Titel,Beschreibung,content='',
+                   tokenize='unicode61 remove_diacritics 2')"""
+  FTS_WEIGHTS = "2.0,4.0,4.0,1.0"            # Gewichte für bm25 (Ranking)
+
+  # Trigger halten den Index bei der inkrementellen Aktualisierung aktuell
+  FTS_TRIGGERS = [
+    """CREATE TRIGGER filme_fts_insert AFTER INSERT ON filme BEGIN
+         INSERT INTO filme_fts(rowid,Sender,Thema,Titel,Beschreibung)
+           VALUES (new.rowid,new.Sender,new.Thema,new.Titel,
+                   new.Beschreibung);
+       END""",
+    """CREATE TRIGGER filme_fts_delete AFTER DELETE ON filme BEGIN
+         INSERT INTO filme_fts(filme_fts,rowid,Sender,Thema,Titel,
+                               Beschreibung)
+           VALUES ('delete',old.rowid,old.Sender,old.Thema,old.Titel,
+                   old.Beschreibung);
+       END"""]
+
   # ------------------------------------------------------------------------
 
   def __init__(self,options):
@@ -31,65 +166,182 @@ class FilmDB:
     self.dbfile = options.dbfile
     self.last_liste = None
     self.lock = Lock()
+    self.local = threading.local()
+    self.connections = []
+    self.conn_lock = threading.Lock()
+    self.schema_pid = None
     self.total = 0
     self.error = 0
+    self.merged = 0
+    self.batch = []
+    self.modus = "voll"
+    self.table = "filme"
+    self.fts   = False
+    self.filter = FilmFilter(self.config)
     self.date_cutoff=(datetime.date.today() -
                       datetime.timedelta(days=self.config["DATE_CUTOFF"]))
 
   # ------------------------------------------------------------------------
 
-  def open(self):
-    """Datenbank öffnen und Cursor zurückgeben"""
-    self.db = sqlite3.connect(self.dbfile,
-                              detect_types=sqlite3.PARSE_DECLTYPES)
-    self.db.row_factory = sqlite3.Row
-    self.cursor = self.db.cursor()
-    return self.cursor
+  def connect(self):
+    """Neue Verbindung zur Datenbank öffnen"""
+    db = sqlite3.connect(self.dbfile,detect_types=sqlite3.PARSE_DECLTYPES,
+                         timeout=self.config["LOCK_TIMEOUT"],
+                         check_same_thread=False)
+    db.row_factory = sqlite3.Row
+    return db
+
+  # ------------------------------------------------------------------------
+
+  def get_db(self):
+    """Verbindung des aktuellen Threads zurückgeben. Die Verbindung wird
+       beim ersten Aufruf geöffnet und danach wiederverwendet (Cache für
+       Seiten und Statements bleibt warm). Ein per fork erzeugter Prozess
+       bekommt eine eigene Verbindung"""
+
+    db = getattr(self.local,"db",None)
+    if db and self.local.pid == os.getpid():
+      return db
+
+    db = self.connect()
+    db.execute("PRAGMA cache_size=%d" % (-1024*self.config["DB_CACHE_SIZE"]))
+    db.execute("PRAGMA mmap_size=%d" % (1048576*self.config["DB_MMAP_SIZE"]))
+    db.execute("PRAGMA synchronous=NORMAL")             # sicher mit WAL
+    self.init_schema(db)
+    self.local.db  = db
+    self.local.pid = os.getpid()
+
+    # Verbindungen beendeter Threads schließen
+    with self.conn_lock:
+      for entry in [e for e in self.connections if not e[1].is_alive()]:
+        self.connections.remove(entry)
+        if entry[0] == os.getpid():
+          entry[2].close()
+      self.connections.append((os.getpid(),threading.current_thread(),db))
+    return db
+
+  # ------------------------------------------------------------------------
+
+  def init_schema(self,db):
+    """WAL-Modus setzen und Hilfstabellen einmalig pro Prozess anlegen.
+       Im WAL-Modus blockieren Leser weder Schreiber noch umgekehrt, der
+       Modus bleibt in der Datei gespeichert"""
+
+    if self.schema_pid == os.getpid():
+      return
+    db.execute("PRAGMA journal_mode=WAL")
+    with db:
+      for stmt in [FilmDB.STATUS_CREATE,FilmDB.DOWNLOADS_CREATE,
+                   FilmDB.RECS_CREATE,FilmDB.ABOS_CREATE,
+                   FilmDB.TREFFER_CREATE] + FilmDB.FACETTEN_CREATE:
+        db.execute(stmt)
+      spalten = [row[1] for row in db.execute("PRAGMA table_info(downloads)")]
+      for name,typ in FilmDB.DOWNLOADS_EXTRA:
+        if name not in spalten:
+          db.execute("ALTER TABLE downloads ADD COLUMN %s %s" % (name,typ))
+    self.schema_pid = os.getpid()
+
+  # ------------------------------------------------------------------------
+
+  def shutdown(self):
+    """Alle Verbindungen dieses Prozesses schließen. Danach öffnet der
+       nächste Zugriff wieder eine neue Verbindung"""
+
+    with self.conn_lock:
+      for pid,_,db in self.connections:
+        if pid == os.getpid():
+          db.close()
+      self.connections = []
+    self.local = threading.local()
 
   # ------------------------------------------------------------------------
 
   def close(self):
-    """Datenbank schließen"""
+    """Verbindung des Imports schließen"""
     self.db.close()
 
   # ------------------------------------------------------------------------
 
-  def create_filmtable(self):
-    """Tabelle Filme löschen und neu erzeugen"""
-    self.db = sqlite3.connect(self.dbfile,
-                              detect_types=sqlite3.PARSE_DECLTYPES)
-    self.cursor = self.db.cursor()
+  def has_filmtable(self):
+    """Prüfen, ob die Tabelle Filme schon existiert"""
+    cursor = self.get_db().execute("""SELECT count(*) FROM sqlite_master
+                                        WHERE type='table' AND name='filme'""")
+    return cursor.fetchone()[0] > 0
 
-    self.cursor.execute("DROP TABLE IF EXISTS filme")
-    self.cursor.execute("""CREATE TABLE filme
-      (Sender text,
-      Thema text,
-      Titel text,
-      Datum date,
-      Zeit text,
-      Dauer text,
-      Groesse integer,
-      Beschreibung text,
-      Url text,
-      Website text,
-      Url_Untertitel text,
-      Url_RTMP text,
-      Url_Klein text,
-      Url_RTMP_Klein text,
-      Url_HD text,
-      Url_RTMP_HD text,
-      DatumL text,
-      Url_History text,
-      Geo text,
-      neu text,
-      _id text primary key )""")
+  # ------------------------------------------------------------------------
+
+  def get_schema(self):
+    """SQL der Tabelle Filme und des Volltextindex als dict zurückgeben"""
+    cursor = self.get_db().execute("""SELECT name,sql FROM sqlite_master
+                         WHERE type='table' AND name IN ('filme','filme_fts')""")
+    return {name: sql for name,sql in cursor.fetchall()}
+
+  # ------------------------------------------------------------------------
+
+  def has_fts(self):
+    """Prüfen, ob der Volltextindex existiert"""
+    return "filme_fts" in self.get_schema()
 
   # ------------------------------------------------------------------------
 
-  def blacklist(self,film_info):
-    """Gibt True zurück für Filme, die eingeschlossen werden sollen"""
-    return (film_info.datum < self.date_cutoff or
-          film_info.dauer_as_minutes() < self.config["DAUER_CUTOFF"])
+  def has_folded(self):
+    """Prüfen, ob die Tabelle Filme die normalisierten Spalten hat (ältere
+       Versionen haben sie noch nicht)"""
+    return "Sender_n" in self.get_schema().get("filme","")
+
+  # ------------------------------------------------------------------------
+
+  def has_nr(self):
+    """Prüfen, ob die Tabelle Filme die Spalte _nr hat. Ohne sie kann ein
+       VACUUM die rowids neu vergeben, auf die der Volltextindex verweist"""
+    return "_nr integer primary key" in self.get_schema().get("filme","")
+
+  # ------------------------------------------------------------------------
+
+  def create_filmtable(self,modus="voll"):
+    """Tabelle für den Import erzeugen. Die Tabelle Filme bleibt bis
+       save_filmtable unverändert, damit Suchen weiter funktionieren.
+       Modus "voll": Neuaufbau in der Tabelle filme_neu, die am Ende gegen
+       die Tabelle Filme ausgetauscht wird.
+       Modus "inkrementell" (komplette Liste) und "diff" (Diff-Liste):
+       die Sätze landen in einer temporären Tabelle und werden in
+       save_filmtable mit der bestehenden Tabelle abgeglichen"""
+
+    if modus != "voll" and not self.has_filmtable():
+      Msg.msg("INFO","Keine Filmtabelle vorhanden, Neuaufbau")
+      modus = "voll"
+    elif modus != "voll" and not (self.has_folded() and self.has_nr()):
+      Msg.msg("INFO","Filmtabelle im alten Format, Neuaufbau")
+      modus = "voll"
+    # Zähler und Puffer gelten pro Import
+    self.modus  = modus
+    self.total  = 0
+    self.error  = 0
+    self.merged = 0
+    self.batch  = []
+
+    self.db = sqlite3.connect(self.dbfile,
+                              detect_types=sqlite3.PARSE_DECLTYPES,
+                              timeout=self.config["LOCK_TIMEOUT"])
+    self.cursor = self.db.cursor()
+    self.cursor.execute("PRAGMA journal_mode=WAL")
+
+    # Pragmas nur für den Import, sie gelten bis zum Schließen der
+    # Verbindung in save_filmtable
+    pragmas = self.INGEST_PRAGMAS
+    if modus == "voll":
+      pragmas = pragmas + self.REBUILD_PRAGMAS
+    for pragma in pragmas:
+      self.cursor.execute("PRAGMA %s" % pragma)
+
+    self.table = "filme_neu"
+    if modus == "voll":
+      # Reste eines abgebrochenen Imports löschen
+      self.cursor.execute("DROP TABLE IF EXISTS main.filme_neu")
+      self.cursor.execute(FilmDB.CREATE_STMT % ("","filme_neu"))
+    else:
+      self.cursor.execute("DROP TABLE IF EXISTS temp.filme_neu")
+      self.cursor.execute(FilmDB.CREATE_STMT % ("TEMP","filme_neu"))
 
   # ------------------------------------------------------------------------
 
@@ -97,8 +349,8 @@ class FilmDB:
     """Ein Record in ein FilmInfo-Objekt umwandeln.
        Dazu erzeugt der JSON-Parser erste eine Liste,
        die anschließend an den Constructor übergeben wird. Damit die
-       Datenbank nicht zu groß wird, werden nur Sätze der letzten x Tage
-       zurückgegeben."""
+       Datenbank nicht zu groß wird, werden nur Sätze zurückgegeben,
+       die der Filter (FilmFilter) durchlässt."""
 
     try:
       liste = json.loads(record)
@@ -114,37 +366,81 @@ class FilmDB:
     # Liste für nächsten Durchgang speichern
     self.last_liste = liste
 
-    if liste[3]:
-      film_info = FilmInfo(*liste)
-    else:
-      # Filme ohne Datum aussortieren (Livestreams)
+    # Filme ohne Datum aussortieren (Livestreams)
+    if not liste[3]:
       return None
 
-    # Sätze per blacklist aussortieren (def in mtv_cfg)
-    if self.blacklist(film_info):
-      return None
+    # Sätze per Filter aussortieren, bevor das FilmInfo-Objekt entsteht
+    if self.filter.accept(liste):
+      return FilmInfo(*liste)
     else:
-      return film_info
+      return None
 
   # ------------------------------------------------------------------------
 
   def insert_film(self,record):
-    """Satz zur Datenbank hinzufügen"""
-    INSERT_STMT = 'INSERT INTO filme VALUES (' + 20 * '?,' + '?)'
+    """Satz zur Datenbank hinzufügen. Die Sätze werden gesammelt und
+       blockweise geschrieben"""
 
     film_info = self.rec2FilmInfo(record)
     if film_info:
-      try:
-        self.cursor.execute(INSERT_STMT,film_info.asTuple())
-        self.total += 1
-      except Exception as ex:
-        Msg.msg("TRACE", f"{ex} beim insert von {record}")
-        self.error += 1
+      self.insert_rows([self.get_row(film_info)])
+
+  # ------------------------------------------------------------------------
+
+  def get_row(self,film_info):
+    """Tupel für die Datenbank: Felder des Films und normalisierte Kopien
+       von Sender, Thema und Titel"""
+    return film_info.asTuple() + (fold(film_info.sender),
+                                  fold(film_info.thema),
+                                  fold(film_info.titel))
+
+  # ------------------------------------------------------------------------
+
+  def insert_rows(self,rows):
+    """Fertige Tupel (get_row()) zur Datenbank hinzufügen"""
+
+    self.batch.extend(rows)
+    if len(self.batch) >= self.config["INSERT_BATCH"]:
+      self.flush_films()
+
+  # ------------------------------------------------------------------------
+
+  def flush_films(self):
+    """Gesammelte Sätze schreiben. Dubletten (_id schon vorhanden) werden
+       ignoriert und über total_changes gezählt. Jeder Block wird sofort
+       festgeschrieben, damit andere Schreiber (Vormerken, Download-Status)
+       nicht lange auf die Sperre der Datenbank warten müssen"""
+
+    if not self.batch:
+      return
+    changes = self.db.total_changes
+    self.cursor.executemany(FilmDB.INSERT_STMT % self.table,self.batch)
+    self.db.commit()
+    inserted    = self.db.total_changes - changes
+    self.total += inserted
+    self.error += len(self.batch) - inserted
+    self.batch  = []
 
   # ------------------------------------------------------------------------
 
   def commit(self):
     """Commit durchführen"""
+    self.flush_films()
+    self.db.commit()
+
+  # ------------------------------------------------------------------------
+
+  def save_import_status(self,text):
+    """Kennzahlen eines laufenden Imports speichern. Das läuft über die
+       Verbindung des Imports, eine zweite Verbindung müsste auf das Ende
+       der offenen Transaktion warten. Die bisher geschriebenen Sätze
+       werden dabei mit festgeschrieben"""
+
+    self.flush_films()
+    self.cursor.execute(FilmDB.STATUS_CREATE)
+    self.cursor.execute(FilmDB.STATUS_INSERT,
+                        ("_import",datetime.datetime.now(),text))
     self.db.commit()
 
   # ------------------------------------------------------------------------
@@ -161,147 +457,443 @@ class FilmDB:
 
   # ------------------------------------------------------------------------
 
+  def get_stored(self):
+    """Anzahl der Sätze zurückgeben, die in der Tabelle Filme gelandet
+       sind. Beim Abgleich sind das die neuen und geänderten Sätze (erst
+       nach dem Abgleich bekannt), beim Neuaufbau alle eingefügten"""
+    return self.total if self.modus == "voll" else self.merged
+
+  # ------------------------------------------------------------------------
+
+  def merge_filmtable(self):
+    """Temporäre Tabelle mit der Tabelle Filme abgleichen: neue und
+       geänderte Sätze übernehmen, alte Sätze löschen. Der Abgleich läuft
+       in einer Transaktion. Ergebnis ist (neu,geändert,gelöscht)"""
+
+    changed = " or ".join(["f.%s IS NOT n.%s" % (col,col)
+                           for col in FilmDB.COLUMNS[:-1]])
+    columns = FilmDB.ROW_COLUMNS
+    self.cursor.execute("""INSERT OR REPLACE INTO filme (%s)
+                             SELECT %s FROM filme_neu AS n
+                               JOIN filme AS f ON f._id = n._id
+                             WHERE %s""" % (columns,
+                     ",".join("n."+c for c in columns.split(",")),changed))
+    geaendert = self.cursor.rowcount
+    self.cursor.execute("""INSERT INTO filme (%s)
+                             SELECT %s FROM filme_neu
+                             WHERE _id NOT IN (SELECT _id FROM filme)""" %
+                        (columns,columns))
+    neu = self.cursor.rowcount
+
+    # Diff-Listen enthalten nur neue Filme, hier gilt nur das Datum
+    geloescht = 0
+    if self.modus == "inkrementell":
+      self.cursor.execute("""DELETE FROM filme
+                               WHERE _id NOT IN (SELECT _id FROM filme_neu)""")
+      geloescht = self.cursor.rowcount
+    self.cursor.execute("DELETE FROM filme WHERE Datum < ?",
+                        (self.date_cutoff,))
+    geloescht += self.cursor.rowcount
+
+    self.cursor.execute("DROP TABLE temp.filme_neu")
+    self.db.commit()
+    self.merged = neu + geaendert
+    Msg.msg("INFO","Anzahl Sätze (neu):         %d" % neu)
+    Msg.msg("INFO","Anzahl Sätze (geändert):    %d" % geaendert)
+    Msg.msg("INFO","Anzahl Sätze (gelöscht):    %d" % geloescht)
+    return neu,geaendert,geloescht
+
+  # ------------------------------------------------------------------------
+
+  def create_indexes(self,table):
+    """Fehlende Indices für die Tabelle erzeugen. Beim Neuaufbau gehören
+       die Namen noch der alten Tabelle, dann wird die Variante mit dem
+       Suffix _2 verwendet (beim nächsten Neuaufbau wieder die ohne)"""
+
+    self.cursor.execute("SELECT name,tbl_name FROM sqlite_master "
+                        "WHERE type='index'")
+    existing = {name: tbl_name for name,tbl_name in self.cursor.fetchall()}
+    for name,column in FilmDB.INDEXES.items():
+      names = [name,name+"_2"]
+      if table in [existing.get(n) for n in names]:
+        continue
+      name = [n for n in names if n not in existing][0]
+      self.cursor.execute("CREATE INDEX %s ON %s(%s)" % (name,table,column))
+
+  # ------------------------------------------------------------------------
+
+  def create_fts(self,table):
+    """Volltextindex <table>_fts für die Tabelle aufbauen. Die Einträge
+       verweisen über die rowid auf die Filme, die beim Umbenennen der
+       Tabelle erhalten bleibt. Ergebnis ist False, falls SQLite ohne
+       FTS5 übersetzt ist (die Suche nutzt dann LIKE)"""
+
+    fts_table = table + "_fts"
+    self.cursor.execute("DROP TABLE IF EXISTS %s" % fts_table)
+    try:
+      self.cursor.execute(FilmDB.FTS_CREATE % fts_table)
+    except sqlite3.OperationalError as ex:
+      Msg.msg("WARN","Kein Volltextindex möglich: %s" % ex)
+      return False
+    self.cursor.execute("""INSERT INTO %s(rowid,%s)
+                             SELECT rowid,%s FROM %s""" %
+                        (fts_table,FilmDB.FTS_COLUMNS,FilmDB.FTS_COLUMNS,table))
+    self.cursor.execute("INSERT INTO %s(%s) VALUES('optimize')" %
+                        (fts_table,fts_table))
+    self.db.commit()
+    return True
+
+  # ------------------------------------------------------------------------
+
+  def create_fts_triggers(self):
+    """Trigger für den Volltextindex der Tabelle Filme anlegen"""
+    for trigger in FilmDB.FTS_TRIGGERS:
+      self.cursor.execute(trigger)
+
+  # ------------------------------------------------------------------------
+
+  def swap_filmtable(self):
+    """Neu aufgebaute Tabelle in einer kurzen Transaktion gegen die
+       Tabelle Filme austauschen. Leser sehen entweder den alten oder den
+       neuen Stand"""
+
+    self.cursor.execute("PRAGMA synchronous=FULL")
+    self.db.isolation_level = None
+    self.cursor.execute("BEGIN IMMEDIATE")
+    try:
+      self.cursor.execute("DROP TABLE IF EXISTS filme")
+      self.cursor.execute("DROP TABLE IF EXISTS filme_fts")
+      self.cursor.execute("ALTER TABLE filme_neu RENAME TO filme")
+      if self.fts:
+        self.cursor.execute("ALTER TABLE filme_neu_fts RENAME TO filme_fts")
+        self.create_fts_triggers()
+      self.cursor.execute("COMMIT")
+    except:
+      self.cursor.execute("ROLLBACK")
+      raise
+    finally:
+      self.db.isolation_level = ""
+
+  # ------------------------------------------------------------------------
+
   def save_filmtable(self):
-    """Filme speichern und Index erstellen"""
+    """Filme speichern, Index erstellen und Tabelle Filme ersetzen"""
     self.db.commit()
-    self.cursor.execute("CREATE index id_index ON filme(_id)")
-    self.cursor.execute("CREATE index sender_index ON filme(sender)")
-    self.cursor.execute("CREATE index thema_index ON filme(thema)")
+    anzahl = self.total
+    abos   = self.read_abos()
+    if self.modus == "voll":
+      self.create_indexes("filme_neu")
+      self.fts = self.create_fts("filme_neu")
+      if abos and self.has_filmtable():
+        self.create_delta("""SELECT rowid FROM filme_neu
+                         WHERE _id NOT IN (SELECT _id FROM filme)""")
+      elif abos:
+        self.create_delta("SELECT rowid FROM filme_neu")
+      self.swap_filmtable()
+    else:
+      # Die Trigger pflegen den Volltextindex beim Abgleich. Beim Ersetzen
+      # (INSERT OR REPLACE) feuert der Delete-Trigger nur mit
+      # recursive_triggers
+      self.cursor.execute("""SELECT count(*) FROM sqlite_master
+                               WHERE type='table' AND name='filme_fts'""")
+      has_fts = self.cursor.fetchone()[0] > 0
+      self.cursor.execute("PRAGMA recursive_triggers=ON")
+      self.cursor.execute("SELECT ifnull(max(rowid),0) FROM filme")
+      max_rowid = self.cursor.fetchone()[0]
+      neu,geaendert,geloescht = self.merge_filmtable()
+      if abos:
+        # neue und geänderte Sätze bekommen eine neue rowid
+        self.create_delta("SELECT rowid FROM filme WHERE rowid > ?",
+                          (max_rowid,))
+      self.cursor.execute("SELECT count(*) FROM filme")
+      anzahl = self.cursor.fetchone()[0]
+      self.create_indexes("filme")
+      if not has_fts and self.create_fts("filme"):
+        self.create_fts_triggers()
+        self.db.commit()
+    if abos:
+      self.eval_abos(abos)
+    self.create_facetten()
     self.db.close()
     self.save_status('_akt')
-    self.save_status('_anzahl',str(self.total))
+    self.save_status('_anzahl',str(anzahl))
+    if self.modus != "voll":
+      self.save_status('_neu',str(neu))
+      self.save_status('_geaendert',str(geaendert))
+      self.save_status('_geloescht',str(geloescht))
 
   # ------------------------------------------------------------------------
 
-  def iso_date(self,datum):
-    """Deutsches Datum in ISO-Datum umwandeln"""
-    parts=datum.split(".")
-    return ("20" if len(parts[2]) == 2 else "") + \
-           parts[2] + "-" + parts[1] + "-" + parts[0]
+  def create_facetten(self):
+    """Anzahl Filme pro Sender, Sender+Thema und Tag neu berechnen. Die
+       Tabellen werden in einer Transaktion ersetzt, die Zählung pro Sender
+       kommt aus der (viel kleineren) Tabelle pro Sender+Thema"""
+
+    for table in ["facetten_sender","facetten_thema","facetten_datum"]:
+      self.cursor.execute("DELETE FROM %s" % table)
+    self.cursor.execute("""INSERT INTO facetten_thema
+                             SELECT Sender,Thema,count(*) FROM filme
+                               GROUP BY Sender,Thema""")
+    self.cursor.execute("""INSERT INTO facetten_sender
+                             SELECT Sender,sum(anzahl) FROM facetten_thema
+                               GROUP BY Sender""")
+    self.cursor.execute("""INSERT INTO facetten_datum
+                             SELECT Datum,count(*) FROM filme
+                               GROUP BY Datum""")
+    self.db.commit()
+
+  # ------------------------------------------------------------------------
+
+  def create_delta(self,statement,params=()):
+    """Temporäre Tabelle filme_delta mit den rowids der neuen Filme
+       (Ergebnis von statement) anlegen"""
+
+    self.cursor.execute("DROP TABLE IF EXISTS temp.filme_delta")
+    self.cursor.execute("CREATE TEMP TABLE filme_delta (id integer primary key)")
+    self.cursor.execute("INSERT INTO temp.filme_delta " + statement,params)
+    self.db.commit()
+
+  # ------------------------------------------------------------------------
+
+  def eval_abos(self,abos):
+    """Abos gegen die neuen Filme (filme_delta) prüfen und Treffer
+       speichern, bei Abos mit vormerken=1 auch als Download vormerken.
+       Alle Abos werden in einem Durchgang über die neuen Filme
+       ausgewertet, die Bedingung jedes Abos ist eine Spalte des Ergebnisses"""
+
+    conditions = []
+    params     = []
+    for abo in abos:
+      where,values = self.get_filmquery(json.loads(abo['suche'])).get_where()
+      conditions.append(where)
+      params.extend(values)
+    statement = """SELECT _id,Datum,%s FROM filme
+                     WHERE rowid IN (SELECT id FROM temp.filme_delta)""" % (
+                  ",".join(conditions))
+
+    now       = datetime.datetime.now()
+    today     = datetime.date.today()
+    treffer   = []
+    downloads = []
+    for row in self.db.execute(statement,params):
+      for abo,match in zip(abos,row[2:]):
+        if match:
+          treffer.append((abo['name'],row[0],now))
+          if abo['vormerken']:
+            downloads.append((row[0],row[1],'V',today,0))
+
+    # Treffer zu nicht mehr vorhandenen Filmen entfernen
+    self.cursor.execute("""DELETE FROM abo_treffer
+                             WHERE _id NOT IN (SELECT _id FROM filme)""")
+    changes = self.db.total_changes
+    self.cursor.executemany("INSERT OR IGNORE INTO abo_treffer VALUES (?,?,?,0)",
+                            treffer)
+    anzahl  = self.db.total_changes - changes
+    changes = self.db.total_changes
+    self.cursor.executemany(FilmDB.DOWNLOADS_INSERT,downloads)
+    vorgemerkt = self.db.total_changes - changes
+    self.db.commit()
+    Msg.msg("INFO","Anzahl Abo-Treffer (neu):   %d" % anzahl)
+    Msg.msg("INFO","Anzahl Abo-Treffer (vorgemerkt): %d" % vorgemerkt)
 
   # ------------------------------------------------------------------------
 
-  def get_query(self,suche):
-    """Aus Suchbegriff eine SQL-Query erzeugen"""
-    #Basisausdruck
-    select_clause = "select * from Filme where "
+  def get_filmquery(self,suche):
+    """FilmQuery-Objekt passend zum Schema der Datenbank erzeugen"""
 
-    if not len(suche):
-      return select_clause[0:-7]                 # remove " where "
-    elif suche[0].lower().startswith("select"):
+    schema = self.get_schema()
+    folded = FilmDB.FOLD_COLUMNS if "Sender_n" in schema.get("filme","") else []
+    return FilmQuery(suche,FilmDB.COLUMNS,"filme_fts" in schema,
+                     FilmDB.FTS_WEIGHTS,folded)
+
+  # ------------------------------------------------------------------------
+
+  def get_query(self,suche,roh=False):
+    """Aus Suchbegriff eine SQL-Query erzeugen. Rohes SQL (select ...) wird
+       nur mit roh=True (Kommandozeile) unverändert übernommen, sonst ist
+       es ein normaler Suchbegriff.
+       Ergebnis ist ein Tupel (Statement,Parameter)"""
+
+    if roh and len(suche) and suche[0].lower().startswith("select"):
       # Suchausdruck ist fertige Query
-      return ' '.join(suche)
-
-    where_clause = ""
-    op = ""
-    for token in suche:
-      if token in ["(","und","oder","and","or",")"]:
-        if op:
-          where_clause = where_clause + op
-        op = " %s " % token
-        continue
-      if ':' in token:
-        # Suche per Schlüsselwort
-        key,value = token.split(":")
-        if where_clause:
-          where_clause = where_clause +  (op if op else " and ")
-        if key.upper() == "DATUM":
-          # Sonderbehandlung Datum:
-          if (">" in value) or ("<" in value) or ("=" in value):
-            # datum:=xxx, datum:>xxx, datum:>=xxx usw.
-            if value[1] in ["<",">","="]:
-              date_op = value[0:2]
-              value = value[2:]
-            else:
-              date_op = value[0]
-              value = value[1:]
-            where_clause = where_clause + "(%s %s '%s')" % \
-                           (key,date_op,self.iso_date(value))
-          elif "-" in value:
-            # datum:start-end
-            limits = value.split("-")
-            where_clause = where_clause + (
-              "(%s >= '%s' and %s <= '%s')" % (key,self.iso_date(limits[0])
-                                           ,key,self.iso_date(limits[1])))
-          else:
-            # datum:xxx (identisch zu datum:=xxx)
-            where_clause = where_clause + "(%s='%s')" % (key,self.iso_date(value))
-        else:
-          where_clause = where_clause + "(%s like '%%%s%%')" % (key,value)
-      else:
-        # Volltextsuche
-        if where_clause:
-          where_clause = where_clause + (op if op else " or ")
-        where_clause = where_clause + (
-          """(Sender       like '%%%s%%' or
-          Thema        like '%%%s%%' or
-          Titel        like '%%%s%%' or
-          Beschreibung like '%%%s%%')""" % (token,token,token,token))
-      op = ""
-
-    # falls noch ein Operator übrig ist:
-    if op:
-      where_clause = where_clause + op
-    Msg.msg("DEBUG","SQL-Where: %s" % where_clause)
-    return select_clause + where_clause
-
-  # ------------------------------------------------------------------------
-
-  def execute_query(self,statement):
-    """Suche ausführen"""
-    cursor = self.open()
-    cursor.execute(statement)
-    result = cursor.fetchall()
-    self.close()
+      return ' '.join(suche),()
+
+    statement,params = self.get_filmquery(suche).get_sql()
+    Msg.msg("DEBUG","SQL: %s, Parameter: %r" % (statement,params))
+    return statement,params
+
+  # ------------------------------------------------------------------------
+
+  def count_query(self,suche):
+    """Anzahl der Treffer einer Suche (ohne rohes SQL) zählen"""
+
+    statement,params = self.get_filmquery(suche).get_count_sql()
+    Msg.msg("DEBUG","SQL: %s, Parameter: %r" % (statement,params))
+    return self.get_db().execute(statement,params).fetchone()[0]
+
+  # ------------------------------------------------------------------------
+
+  def read_facetten(self,sender=None):
+    """Vorberechnete Anzahl Filme pro Sender und Tag auslesen, für einen
+       Sender (exakter Name) auch pro Thema. Ergebnis ist ein dict mit
+       Listen von Tupeln (sender: (Sender,n), thema: (Sender,Thema,n),
+       datum: (Datum,n))"""
+
+    db = self.get_db()
+    result = {"sender": [tuple(row) for row in db.execute(
+                 "SELECT Sender,anzahl FROM facetten_sender ORDER BY Sender")],
+              "thema":  [],
+              "datum":  [tuple(row) for row in db.execute(
+                 "SELECT Datum,anzahl FROM facetten_datum ORDER BY Datum DESC")]}
+    if sender:
+      result["thema"] = [tuple(row) for row in db.execute(
+                 """SELECT Sender,Thema,anzahl FROM facetten_thema
+                      WHERE Sender=? ORDER BY Thema""",(sender,))]
     return result
 
   # ------------------------------------------------------------------------
 
+  def count_facetten(self,suche):
+    """Anzahl Filme pro Sender, Sender+Thema und Tag für das Ergebnis einer
+       Suche zählen. Die Suche selbst nutzt wie sonst auch die Indices (z.B.
+       bei sender:xxx), gezählt wird in einem Durchgang über die Treffer.
+       Ergebnis wie bei read_facetten()"""
+
+    statement,params = self.get_query(suche)
+    statement = """SELECT Sender,Thema,Datum,count(*) FROM (%s)
+                     GROUP BY Sender,Thema,Datum""" % statement
+    sender = {}
+    thema  = {}
+    datum  = {}
+    for s,t,d,n in self.get_db().execute(statement,params):
+      sender[s]   = sender.get(s,0) + n
+      thema[s,t]  = thema.get((s,t),0) + n
+      datum[d]    = datum.get(d,0) + n
+    return {"sender": sorted(sender.items()),
+            "thema":  sorted((s,t,n) for (s,t),n in thema.items()),
+            "datum":  sorted(datum.items(),reverse=True)}
+
+  # ------------------------------------------------------------------------
+
+  def get_page(self,statement,params,limit,offset=0):
+    """Statement auf eine Seite (limit Sätze ab offset) beschränken.
+       Die Sortierung des Statements bleibt dabei erhalten"""
+    return ("select * from (%s) limit ? offset ?" % statement,
+            tuple(params) + (limit,offset))
+
+  # ------------------------------------------------------------------------
+
+  def iter_query(self,statement,params=(),limit=None,offset=0):
+    """Suche ausführen und die Sätze einzeln liefern (Generator).
+       Die Sätze werden blockweise gelesen, im Speicher liegen also nie
+       mehr als FETCH_SIZE Sätze"""
+
+    if limit is not None:
+      statement,params = self.get_page(statement,params,limit,offset)
+    cursor = self.get_db().cursor()
+    try:
+      cursor.execute(statement,params)
+      while True:
+        rows = cursor.fetchmany(FETCH_SIZE)
+        if not rows:
+          return
+        yield from rows
+    finally:
+      cursor.close()
+
+  # ------------------------------------------------------------------------
+
+  def get_plan(self,statement,params=()):
+    """Ausführungsplan (EXPLAIN QUERY PLAN) als Liste eingerückter Zeilen"""
+
+    rows  = self.get_db().execute("EXPLAIN QUERY PLAN " + statement,
+                                  params).fetchall()
+    depth = {}
+    plan  = []
+    for id,parent,_,detail in rows:
+      depth[id] = depth.get(parent,-1) + 1
+      plan.append("  "*depth[id] + detail)
+    return plan
+
+  # ------------------------------------------------------------------------
+
+  def get_stmt_stats(self,statement):
+    """Zähler des übersetzten Statements (Schritte bei Tabellen-Scans,
+       Sortierungen, automatische Indizes, VM-Schritte). Die Werte kommen
+       aus der virtuellen Tabelle sqlite_stmt, ohne sie ist das Ergebnis
+       None"""
+
+    try:
+      row = self.get_db().execute("""SELECT sum(nscan),sum(nsort),sum(naidx),
+                               sum(nstep) FROM sqlite_stmt WHERE sql=?""",
+                                  (statement,)).fetchone()
+    except sqlite3.OperationalError:
+      return None
+    return [value or 0 for value in row]
+
+  # ------------------------------------------------------------------------
+
+  def explain_query(self,statement,params=()):
+    """Suche ausführen und dabei messen. Ergebnis ist ein dict mit
+       Statement, Parametern, Ausführungsplan, Anzahl gelieferter Sätze,
+       Zählern aus get_stmt_stats() (oder None) und Laufzeit in Sekunden"""
+
+    plan   = self.get_plan(statement,params)
+    before = self.get_stmt_stats(statement)
+    start  = time.perf_counter()
+    rows   = sum(1 for _ in self.iter_query(statement,params))
+    zeit   = time.perf_counter() - start
+    after  = self.get_stmt_stats(statement)
+
+    stats = None
+    if before is not None and after is not None:
+      stats = dict(zip(["scan","sort","autoindex","vm"],
+                       [a-b for a,b in zip(after,before)]))
+    return {"sql": statement, "params": params, "plan": plan,
+            "rows": rows, "stats": stats, "zeit": zeit}
+
+  # ------------------------------------------------------------------------
+
+  def execute_query(self,statement,params=(),limit=None,offset=0):
+    """Suche ausführen, optional nur limit Sätze ab offset"""
+    if limit is not None:
+      statement,params = self.get_page(statement,params,limit,offset)
+    return self.get_db().execute(statement,params).fetchall()
+
+  # ------------------------------------------------------------------------
+
   def read_filme(self,index_liste):
     """Alle Filme lesen, deren _id in index_liste ist"""
 
     # Zeilen lesen
-    cursor = self.open()
-    statement = "select * from Filme where _id in %s" % str(tuple(index_liste))
-    cursor.execute(statement)
-    rows = cursor.fetchall()
-    self.close()
+    statement = "select %s from Filme where _id in (%s)" % (
+                  FilmDB.SELECT_COLUMNS,",".join("?"*len(index_liste)))
+    rows = self.get_db().execute(statement,tuple(index_liste)).fetchall()
 
     # Zeilen als Liste von FilmInfo-Objekten zurückgeben
     return [FilmInfo(*row) for row in rows]
 
   # ------------------------------------------------------------------------
 
-  def save_downloads(self,rows):
+  def save_downloads(self,rows,prio=0):
     """Downloads, sichern.
-       rows ist eine Liste von (_id,Datum,Status)-Tupeln"""
-
-    CREATE_STMT = """CREATE TABLE IF NOT EXISTS downloads (
-                     _id          text primary key,
-                     Datum        date,
-                     status       text,
-                     DatumStatus  date)"""
-    INSERT_STMT = """INSERT OR IGNORE INTO downloads Values (?,?,?,?)"""
+       rows ist eine Liste von (_id,Datum,Status)-Tupeln, prio die
+       Priorität (höhere Werte werden zuerst geladen)"""
 
-    # Aktuelles Datum an Werte anfügen
+    # Aktuelles Datum und Priorität an Werte anfügen
     today = datetime.date.today()
     for i in range(len(rows)):
-      rows[i] = rows[i] + (today,)
-
-    # Tabelle bei Bedarf erstellen
-    cursor = self.open()
-    cursor.execute(CREATE_STMT)
-    self.commit()
+      rows[i] = rows[i] + (today,prio)
 
     # Ein Lock ist hier nicht nötig, da Downloads bei -V immer in
     # einem eigenen Aufruf von mtv_cli stattfinden und bei -S immer
     # nach save_downloads
 
-    cursor.executemany(INSERT_STMT,rows)
-    changes = self.db.total_changes
-    self.commit()
-    self.close()
-    return changes
+    db = self.get_db()
+    changes = db.total_changes
+    with db:
+      db.executemany(FilmDB.DOWNLOADS_INSERT,rows)
+    return db.total_changes - changes
 
   # ------------------------------------------------------------------------
 
@@ -314,28 +906,67 @@ class FilmDB:
     # Ein Lock ist hier nicht nötig, da Downloads immer in
     # einem eigene Aufruf von mtv_cli stattfinden
 
-    cursor = self.open()
-    cursor.executemany(DEL_STMT,rows)
-    changes = self.db.total_changes
-    self.commit()
-    self.close()
-    return changes
+    db = self.get_db()
+    changes = db.total_changes
+    with db:
+      db.executemany(DEL_STMT,rows)
+    return db.total_changes - changes
+
+  # ------------------------------------------------------------------------
+
+  def update_prio(self,rows,prio):
+    """Priorität vorgemerkter Filme ändern.
+       rows ist eine Liste von (_id,)-Tupeln"""
+
+    UPD_STMT = "UPDATE downloads SET prio=? where _id=?"
+    db = self.get_db()
+    changes = db.total_changes
+    with self.lock, db:
+      db.executemany(UPD_STMT,[(prio,row[0]) for row in rows])
+    return db.total_changes - changes
+
+  # ------------------------------------------------------------------------
+
+  def get_order(self,reihenfolge):
+    """ORDER BY-Klausel für die Downloads aus der Liste der Kriterien
+       (z.B. "prio,groesse") erstellen"""
+
+    order = []
+    for key in reihenfolge.replace(" ","").lower().split(","):
+      if key in FilmDB.DOWNLOADS_ORDER:
+        order.append(FilmDB.DOWNLOADS_ORDER[key])
+      elif key:
+        Msg.msg("WARN","Unbekanntes Kriterium für die Reihenfolge: %s" % key)
+    return ",".join(order + ["d.Datum","d._id"])
 
   # ------------------------------------------------------------------------
 
   def update_downloads(self,_id,status):
     """Status eines Satzes ändern"""
     UPD_STMT = "UPDATE downloads SET status=?,DatumStatus=? where _id=?"
-    with self.lock:
-      cursor = self.open()
-      cursor.execute(UPD_STMT,(status,datetime.date.today(),_id))
-      self.commit()
-      self.close()
+    db = self.get_db()
+    with self.lock, db:
+      db.execute(UPD_STMT,(status,datetime.date.today(),_id))
 
   # ------------------------------------------------------------------------
 
-  def read_downloads(self,ui=True,status="'V','S','A','F','K'"):
-    """Downloads auslesen. Falls ui=True, Subset für Anzeige.
+  def update_fortschritt(self,_id,geladen,erwartet,rate,eta):
+    """Fortschritt eines aktiven Downloads speichern (Bytes, erwartete
+       Größe in Bytes, Rate in Bytes/s, Restzeit in Sekunden)"""
+
+    UPD_STMT = """UPDATE downloads SET geladen=?,erwartet=?,rate=?,eta=?,
+                                       ZeitFortschritt=? where _id=?"""
+    db = self.get_db()
+    with self.lock, db:
+      db.execute(UPD_STMT,(geladen,erwartet,rate,eta,
+                           datetime.datetime.now(),_id))
+
+  # ------------------------------------------------------------------------
+
+  def read_downloads(self,ui=True,status="'V','S','A','F','K'",
+                     reihenfolge="prio"):
+    """Downloads auslesen. Falls ui=True, Subset für Anzeige, sonst in der
+       Reihenfolge für den Download (siehe DOWNLOADS_ORDER).
        Bedeutung der Status-Codes:
        V - Vorgemerkt
        S - Sofort
@@ -353,24 +984,30 @@ class FilmDB:
                            f.thema       as thema,
                            f.titel       as titel,
                            f.dauer       as dauer,
-                           f.datum       as datum
+                           f.datum       as datum,
+                           d.prio        as prio,
+                           d.geladen     as geladen,
+                           d.erwartet    as erwartet,
+                           d.rate        as rate,
+                           d.eta         as eta,
+                           d.ZeitFortschritt as ZeitFortschritt
                       FROM filme as f, downloads as d
                         WHERE f._id = d._id AND d.status in (%s)
                         ORDER BY DatumStatus DESC""" % status
     else:
-      SEL_STMT = """SELECT f.*
+      SEL_STMT = """SELECT %s
                       FROM filme as f, downloads as d
-                        WHERE f._id = d._id AND d.status in (%s)""" % status
+                        WHERE f._id = d._id AND d.status in (%s)
+                        ORDER BY %s""" % (
+                  ",".join("f."+col for col in FilmDB.COLUMNS),status,
+                  self.get_order(reihenfolge))
 
     Msg.msg("DEBUG","SQL-Query: %s" % SEL_STMT)
-    cursor = self.open()
     try:
-      cursor.execute(SEL_STMT)
-      rows = cursor.fetchall()
+      rows = self.get_db().execute(SEL_STMT).fetchall()
     except sqlite3.OperationalError as e:
       Msg.msg("DEBUG","SQL-Fehler: %s" % e)
       rows = None
-    self.close()
     if ui:
       return rows
     else:
@@ -381,37 +1018,25 @@ class FilmDB:
   def save_status(self,key,text=None):
     """Status in Status-Tabelle speichern"""
 
-    CREATE_STMT = """CREATE TABLE IF NOT EXISTS status (
-                     key          text primary key,
-                     Zeit         timestamp,
-                     text         text)"""
-    INSERT_STMT = """INSERT OR REPLACE INTO status Values (?,?,?)"""
-
     # Zeitstempel
     now = datetime.datetime.now()
 
-    # Tabelle bei Bedarf erstellen
-    with self.lock:
-      cursor = self.open()
-      cursor.execute(CREATE_STMT)
-      self.commit()
-      cursor.execute(INSERT_STMT,(key,now,text))
-      self.commit()
-      self.close()
+    db = self.get_db()
+    with self.lock, db:
+      db.execute(FilmDB.STATUS_INSERT,(key,now,text))
 
   # ------------------------------------------------------------------------
 
   def read_status(self,keys):
     """Status aus Status-Tabelle auslesen"""
 
-    SEL_STMT = "SELECT * FROM status WHERE key in %s" % str(tuple(keys))
+    SEL_STMT = "SELECT * FROM status WHERE key in (%s)" % ",".join(
+                                                              "?"*len(keys))
     rows = None
     try:
+      db = self.get_db()
       with self.lock:
-        cursor = self.open()
-        cursor.execute(SEL_STMT)
-        rows = cursor.fetchall()
-        self.close()
+        rows = db.execute(SEL_STMT,tuple(keys)).fetchall()
     except sqlite3.OperationalError as e:
       Msg.msg("DEBUG","SQL-Fehler: %s" % e)
     return rows
@@ -422,13 +1047,6 @@ class FilmDB:
     """Aufnahme sichern."""
 
     Msg.msg("INFO","Sichere Aufnahmen: %s,%s" % (id,Dateiname))
-    CREATE_STMT = """CREATE TABLE IF NOT EXISTS recordings (
-                     Sender       text,
-                     Titel        text,
-                     Beschreibung text,
-                     DatumFilm    date,
-                     Dateiname    text primary key,
-                     DatumDatei   date)"""
     INSERT_STMT = """INSERT OR IGNORE INTO recordings Values (?,?,?,?,?,?)"""
     SEL_STMT    = """SELECT sender,
                             titel,
@@ -438,37 +1056,27 @@ class FilmDB:
                         WHERE _id = ?"""
 
     # ausgewählte Felder aus Film-DB lesen
-    cursor = self.open()
+    db = self.get_db()
     try:
       Msg.msg("DEBUG","SQL-Query: %s" % SEL_STMT)
-      cursor.execute(SEL_STMT,(id,))
-      row = cursor.fetchone()
+      row = db.execute(SEL_STMT,(id,)).fetchone()
     except sqlite3.OperationalError as e:
       Msg.msg("DEBUG","SQL-Fehler: %s" % e)
       row = None
 
     if not row:
-      self.close()
       return
     for r in row:
       Msg.msg("INFO","row: %r" % r)
 
-    # Tabelle bei Bedarf erstellen
-    Msg.msg("DEBUG","SQL-Create: %s" % CREATE_STMT)
-    cursor.execute(CREATE_STMT)
-    self.commit()
-
-    # ohne Lock, da Insert mit neuem Schlüssel
     try:
-      with self.lock:
+      with self.lock, db:
         Msg.msg("DEBUG","SQL-Insert: %s" % INSERT_STMT)
-        cursor.execute(
+        db.execute(
           INSERT_STMT, tuple(row) + (Dateiname,datetime.date.today())
         )
-        self.commit()
     except sqlite3.OperationalError as e:
       Msg.msg("DEBUG","SQL-Fehler: %s" % e)
-    self.close()
 
   # ------------------------------------------------------------------------
 
@@ -482,12 +1090,11 @@ class FilmDB:
     # Ein Lock ist hier nicht nötig, da Downloads immer in
     # einem eigene Aufruf von mtv_cli stattfinden
 
-    cursor = self.open()
-    cursor.executemany(DEL_STMT,rows)
-    changes = self.db.total_changes
-    self.commit()
-    self.close()
-    return changes
+    db = self.get_db()
+    changes = db.total_changes
+    with db:
+      db.executemany(DEL_STMT,rows)
+    return db.total_changes - changes
 
   # ------------------------------------------------------------------------
 
@@ -500,15 +1107,92 @@ class FilmDB:
       SEL_STMT = "SELECT * from recordings"
 
     Msg.msg("DEBUG","SQL-Query: %s" % SEL_STMT)
-    cursor = self.open()
     try:
       if Dateiname:
-        cursor.execute(SEL_STMT,(Dateiname,))
+        rows = self.get_db().execute(SEL_STMT,(Dateiname,)).fetchall()
       else:
-        cursor.execute(SEL_STMT)
-      rows = cursor.fetchall()
+        rows = self.get_db().execute(SEL_STMT).fetchall()
     except sqlite3.OperationalError as e:
       Msg.msg("DEBUG","SQL-Fehler: %s" % e)
       rows = None
-    self.close()
     return rows
+
+  # ------------------------------------------------------------------------
+
+  def save_abo(self,name,suche,vormerken=False):
+    """Suche als Abo speichern. Bei einem vorhandenen Abo werden Suche und
+       Vormerken ersetzt, das Datum der Anlage bleibt erhalten. Das Abo
+       wird bei jeder Aktualisierung gegen die neuen Filme geprüft.
+       Ergebnis ist False, falls der Suchausdruck nicht verwendbar ist"""
+
+    if not suche or suche[0].lower().startswith("select") or \
+                    self.get_filmquery(suche).get_where()[0] is None:
+      return False
+    INSERT_STMT = """INSERT INTO abos Values (?,?,?,?)
+                       ON CONFLICT(name) DO UPDATE SET
+                         suche=excluded.suche,vormerken=excluded.vormerken"""
+    db = self.get_db()
+    with db:
+      db.execute(INSERT_STMT,(name,json.dumps(suche),int(vormerken),
+                              datetime.datetime.now()))
+    return True
+
+  # ------------------------------------------------------------------------
+
+  def delete_abo(self,name):
+    """Abo samt Treffern löschen. Ergebnis ist die Anzahl gelöschter Abos"""
+
+    db = self.get_db()
+    with db:
+      count = db.execute("DELETE FROM abos WHERE name=?",(name,)).rowcount
+      db.execute("DELETE FROM abo_treffer WHERE name=?",(name,))
+    return count
+
+  # ------------------------------------------------------------------------
+
+  def read_abos(self):
+    """Alle Abos mit Anzahl der Treffer (gesamt und noch nicht gemeldet)
+       auslesen"""
+
+    SEL_STMT = """SELECT a.name      as name,
+                         a.suche     as suche,
+                         a.vormerken as vormerken,
+                         a.angelegt  as angelegt,
+                         count(t._id) as treffer,
+                         ifnull(sum(t.gemeldet = 0),0) as neu
+                    FROM abos as a LEFT JOIN abo_treffer as t
+                      ON t.name = a.name
+                    GROUP BY a.name ORDER BY a.name"""
+    return self.get_db().execute(SEL_STMT).fetchall()
+
+  # ------------------------------------------------------------------------
+
+  def read_treffer(self,name=None,neu=False):
+    """Treffer der Abos (optional nur eines Abos, optional nur noch nicht
+       gemeldete) mit den Daten der Filme auslesen"""
+
+    where  = []
+    params = []
+    if name:
+      where.append("t.name=?")
+      params.append(name)
+    if neu:
+      where.append("t.gemeldet=0")
+    SEL_STMT = """SELECT t.name as abo, t.gefunden as gefunden,
+                         t.gemeldet as gemeldet, %s
+                    FROM abo_treffer as t JOIN filme as f ON f._id = t._id
+                    %s ORDER BY t.name, f.Datum DESC""" % (
+               ",".join("f."+col for col in FilmDB.COLUMNS),
+               "WHERE " + " AND ".join(where) if where else "")
+    return self.get_db().execute(SEL_STMT,params).fetchall()
+
+  # ------------------------------------------------------------------------
+
+  def mark_treffer(self,rows):
+    """Treffer als gemeldet markieren.
+       rows ist eine Liste von (Abo,_id)-Tupeln"""
+
+    UPD_STMT = "UPDATE abo_treffer SET gemeldet=1 WHERE name=? AND _id=?"
+    db = self.get_db()
+    with db:
+      db.executemany(UPD_STMT,rows)
@@ -12,11 +12,61 @@
 #
 # --------------------------------------------------------------------------
 
-import datetime, hashlib
+import datetime, hashlib, sys, unicodedata
+from functools import lru_cache
+
+# --- Datumsstring in Date-Objekt   -----------------------------------------
+
+@lru_cache(maxsize=1024)
+def to_date(datum):
+  """Datumsstring in ein Date-Objekt umwandeln. Die Filmliste enthält nur
+     wenige verschiedene Daten, deshalb wird das Ergebnis gecached"""
+  if '.' in datum:
+    return datetime.datetime.strptime(datum,"%d.%m.%Y").date()
+  else:
+    # schon im ISO-Format
+    return datetime.datetime.strptime(datum,"%Y-%m-%d").date()
+
+# --- Dauer HH:MM:SS in Minuten   -------------------------------------------
+
+@lru_cache(maxsize=8192)
+def dauer_as_minutes(dauer):
+  """Dauer HH:MM:SS in Minuten (Integer) umwandeln (mit Cache)"""
+  if isinstance(dauer,int):
+    return dauer
+  elif dauer:
+    parts = dauer.split(":")
+    minutes = 60*int(parts[0])+int(parts[1])
+    if int(parts[2]) > 30:
+      # Aufrunden von Sekunden
+      minutes += 1
+    return minutes
+  else:
+    return 999
+
+# --- Text für die Suche normalisieren   ------------------------------------
+
+def fold(text):
+  """Text in Kleinbuchstaben ohne Akzente/Umlaute umwandeln (Ä -> a,
+     ß -> ss, Ligaturen wie ﬁ -> fi). Der Volltextindex (unicode61) faltet
+     nur Groß-/Kleinschreibung und Akzente, ß und Ligaturen bleiben dort
+     erhalten. Suchen in Feldern finden deshalb "Straße" auch mit
+     "strasse", die generische Suche nicht"""
+  if text.isascii():
+    return text.lower()
+  return "".join(c for c in unicodedata.normalize("NFKD",text.casefold())
+                 if not unicodedata.combining(c))
+
+# --- Info über einen einzelnen Film   --------------------------------------
 
 class FilmInfo:
   """Info über einen einzelnen Film"""
 
+  __slots__ = ("sender","thema","titel","datum","zeit","dauer","groesse",
+               "beschreibung","url","website","url_untertitel","url_rtmp",
+               "url_klein","url_rtmp_klein","url_hd","url_rtmp_hd","datumL",
+               "url_history","geo","neu","_id")
+
     # ------------------------------------------------------------------------
 
   def __init__(self,sender,thema,titel,datum,zeit,dauer,
@@ -25,8 +75,9 @@ class FilmInfo:
                url_history,geo,neu,_id=None):
     """FilmInfo-Objekt erzeugen"""
 
-    self.sender         = sender
-    self.thema          = thema
+    # Sender und Thema wiederholen sich ständig
+    self.sender         = sys.intern(sender)
+    self.thema          = sys.intern(thema)
     self.titel          = titel
     self.datum          = self.to_date(datum)
     self.zeit           = zeit
@@ -57,27 +108,13 @@ class FilmInfo:
     """Datumsstring in ein Date-Objekt umwandeln"""
     if isinstance(datum,datetime.date):
       return datum
-    if '.' in datum:
-      return datetime.datetime.strptime(datum,"%d.%m.%Y").date()
-    else:
-      # schon im ISO-Format
-      return datetime.datetime.strptime(datum,"%Y-%m-%d").date()
+    return to_date(datum)
 
   # ------------------------------------------------------------------------
 
   def dauer_as_minutes(self):
     """Dauer HH:MM:SS in Minuten (Integer) umwandeln"""
-    if isinstance(self.dauer,int):
-      return self.dauer
-    elif self.dauer:
-      parts = self.dauer.split(":")
-      minutes = 60*int(parts[0])+int(parts[1])
-      if int(parts[2]) > 30:
-        # Aufrunden von Sekunden
-        minutes += 1
-      return minutes
-    else:
-      return 999
+    return dauer_as_minutes(self.dauer)
 
   # ------------------------------------------------------------------------
 
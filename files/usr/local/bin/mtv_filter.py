@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# --------------------------------------------------------------------------
+# Mediathekview auf der Kommandozeile
+#
+# Class FilmFilter: Filter für den Import der Filmliste
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/mtv_cli
+#
+# --------------------------------------------------------------------------
+
+import datetime, re
+
+from mtv_filminfo import dauer_as_minutes
+
+class FilmFilter:
+  """Filter für den Import. Die Prüfungen arbeiten auf der rohen Liste
+     des JSON-Parsers und laufen von billig nach teuer. Ein FilmInfo-Objekt
+     (mit Datumskonvertierung und Hash) entsteht nur für Sätze, die alle
+     Prüfungen bestehen.
+
+     Regeln (Abschnitt [FILTER] der Konfiguration, alle optional):
+       SENDER_NUR, SENDER_OHNE: Liste von Sendern (kommagetrennt)
+       GEO_NUR, GEO_OHNE:       Liste von Ländercodes (kommagetrennt)
+       THEMA_NUR, THEMA_OHNE:   regulärer Ausdruck
+       TITEL_NUR, TITEL_OHNE:   regulärer Ausdruck
+     Groß-/Kleinschreibung spielt keine Rolle."""
+
+  # ------------------------------------------------------------------------
+
+  def __init__(self,config):
+    """Constructor"""
+    rules = config.get("FILTER",{})
+
+    self.sender_nur  = self.get_set(rules,"SENDER_NUR")
+    self.sender_ohne = self.get_set(rules,"SENDER_OHNE")
+    self.geo_nur     = self.get_set(rules,"GEO_NUR")
+    self.geo_ohne    = self.get_set(rules,"GEO_OHNE")
+    self.thema_nur   = self.get_regex(rules,"THEMA_NUR")
+    self.thema_ohne  = self.get_regex(rules,"THEMA_OHNE")
+    self.titel_nur   = self.get_regex(rules,"TITEL_NUR")
+    self.titel_ohne  = self.get_regex(rules,"TITEL_OHNE")
+
+    # Datum als YYYYMMDD, damit der Vergleich ohne strptime auskommt
+    cutoff = (datetime.date.today() -
+              datetime.timedelta(days=config["DATE_CUTOFF"]))
+    self.date_cutoff  = cutoff.strftime("%Y%m%d")
+    self.dauer_cutoff = config["DAUER_CUTOFF"]
+
+  # ------------------------------------------------------------------------
+
+  def get_set(self,rules,key):
+    """Kommagetrennte Liste als Menge (Kleinbuchstaben) zurückgeben"""
+    value = rules.get(key,"")
+    return {v.strip().lower() for v in value.split(",") if v.strip()}
+
+  # ------------------------------------------------------------------------
+
+  def get_regex(self,rules,key):
+    """Regulären Ausdruck kompilieren"""
+    value = rules.get(key,"")
+    return re.compile(value,re.IGNORECASE) if value else None
+
+  # ------------------------------------------------------------------------
+
+  def accept(self,liste):
+    """Gibt True zurück für Filme, die importiert werden sollen.
+       liste ist die Liste des JSON-Parsers (Sender und Thema sind schon
+       ergänzt, ein Datum ist vorhanden)"""
+
+    # Sender (Mengenvergleich)
+    if self.sender_nur or self.sender_ohne:
+      sender = liste[0].lower()
+      if self.sender_nur and sender not in self.sender_nur:
+        return False
+      if sender in self.sender_ohne:
+        return False
+
+    # Geo: Filme ohne Einschränkung sind überall verfügbar
+    if (self.geo_nur or self.geo_ohne) and liste[18]:
+      geo = set(liste[18].lower().split("-"))
+      if self.geo_nur and not geo & self.geo_nur:
+        return False
+      if geo & self.geo_ohne:
+        return False
+
+    # Datum (TT.MM.JJJJ oder JJJJ-MM-TT) als String vergleichen
+    datum = liste[3]
+    if '.' in datum:
+      datum = datum[6:10] + datum[3:5] + datum[0:2]
+    else:
+      datum = datum.replace("-","")
+    if datum < self.date_cutoff:
+      return False
+
+    # Dauer
+    if dauer_as_minutes(liste[5]) < self.dauer_cutoff:
+      return False
+
+    # reguläre Ausdrücke zum Schluss
+    if self.thema_nur and not self.thema_nur.search(liste[1]):
+      return False
+    if self.thema_ohne and self.thema_ohne.search(liste[1]):
+      return False
+    if self.titel_nur and not self.titel_nur.search(liste[2]):
+      return False
+    if self.titel_ohne and self.titel_ohne.search(liste[2]):
+      return False
+    return True
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# --------------------------------------------------------------------------
+# Mediathekview auf der Kommandozeile
+#
+# Class HlsDownload: Download von HLS-Playlisten (m3u8) ohne externes Programm
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/mtv_cli
+#
+# --------------------------------------------------------------------------
+
+import os, re, json, collections
+import http.client
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin
+
+from mtv_const  import BUFSIZE
+from mtv_msg    import Msg as Msg
+
+class HlsDownload:
+  """Download einer HLS-Playlist.
+
+     Eine Master-Playlist wird passend zur Qualität aufgelöst, danach
+     werden die Segmente parallel geladen (höchstens parallel Segmente
+     gleichzeitig im Speicher) und in der richtigen Reihenfolge an die
+     Zieldatei angehängt. Der Stand steht nach jedem Segment in der Datei
+     ziel.hls, ein abgebrochener Download wird dort fortgesetzt"""
+
+  ATTRIBUT = re.compile(r'([A-Z0-9-]+)=("[^"]*"|[^,]*)')
+  SD_ZEILEN = 576                       # max. Bildhöhe für Qualität SD
+
+  # ------------------------------------------------------------------------
+
+  def __init__(self,loader,qualitaet="HD",parallel=4):
+    """Constructor. loader ist ein HttpDownload-Objekt"""
+    self.loader    = loader
+    self.qualitaet = qualitaet
+    self.parallel  = max(1,parallel)
+
+  # ------------------------------------------------------------------------
+
+  def get_attribute(self,line):
+    """Attribute einer Tag-Zeile (#EXT-X-...:A=1,B="x") als Dict"""
+
+    attrs = {}
+    for name,value in HlsDownload.ATTRIBUT.findall(line.partition(':')[2]):
+      attrs[name] = value.strip('"')
+    return attrs
+
+  # ------------------------------------------------------------------------
+
+  def get_playlist(self,url):
+    """Playlist laden. Ergebnis ist (Zeilen,URL nach den Weiterleitungen)"""
+
+    data,url = self.loader.get(url)
+    text  = data.decode("utf-8","replace")
+    lines = [line.strip() for line in text.splitlines()]
+    if not lines or not lines[0].startswith("#EXTM3U"):
+      raise IOError("Keine HLS-Playlist: %s" % url)
+    return lines,url
+
+  # ------------------------------------------------------------------------
+
+  def select_variant(self,varianten):
+    """Variante passend zur Qualität auswählen: HD ist die höchste, LOW die
+       niedrigste Bandbreite, SD die beste Variante bis SD_ZEILEN (ohne
+       Angabe der Auflösung die mittlere)"""
+
+    varianten.sort(key=lambda v: v[0])
+    if self.qualitaet == "HD":
+      return varianten[-1]
+    elif self.qualitaet == "LOW":
+      return varianten[0]
+    sd = [v for v in varianten if 0 < v[1] <= HlsDownload.SD_ZEILEN]
+    return sd[-1] if sd else varianten[len(varianten)//2]
+
+  # ------------------------------------------------------------------------
+
+  def get_segmente(self,url):
+    """Liste der Segment-URLs ermitteln, eine Master-Playlist wird dabei
+       aufgelöst. Ergebnis ist (Playlist-URL,Segmente)"""
+
+    lines,url = self.get_playlist(url)
+
+    # Master-Playlist: Varianten sammeln (Bandbreite,Bildhöhe,URL)
+    varianten = []
+    attrs     = None
+    for line in lines:
+      if line.startswith("#EXT-X-STREAM-INF"):
+        attrs = self.get_attribute(line)
+      elif attrs is not None and line and not line.startswith("#"):
+        hoehe = attrs.get("RESOLUTION","x0").partition("x")[2]
+        varianten.append((int(attrs.get("BANDWIDTH",0) or 0),
+                          int(hoehe) if hoehe.isdigit() else 0,
+                          urljoin(url,line)))
+        attrs = None
+    if varianten:
+      bandbreite,hoehe,url = self.select_variant(varianten)
+      Msg.msg("DEBUG","HLS-Variante %d bit/s, %d Zeilen: %s" %
+              (bandbreite,hoehe,url))
+      lines,url = self.get_playlist(url)
+
+    # Media-Playlist
+    segmente = []
+    for line in lines:
+      if line.startswith("#EXT-X-KEY"):
+        if self.get_attribute(line).get("METHOD","NONE") != "NONE":
+          raise IOError("Verschlüsselte Playlist wird nicht unterstützt")
+      elif line.startswith("#EXT-X-BYTERANGE"):
+        raise IOError("Playlist mit Byte-Bereichen wird nicht unterstützt")
+      elif line.startswith("#EXT-X-MAP"):
+        init = urljoin(url,self.get_attribute(line)["URI"])
+        if init not in segmente:
+          segmente.append(init)
+      elif line and not line.startswith("#"):
+        segmente.append(urljoin(url,line))
+    if not segmente:
+      raise IOError("Playlist ohne Segmente: %s" % url)
+    return url,segmente
+
+  # ------------------------------------------------------------------------
+
+  def read_state(self,ziel,playlist):
+    """Stand eines abgebrochenen Downloads lesen und die Zieldatei auf das
+       letzte komplette Segment kürzen. Ergebnis ist die Anzahl der schon
+       geschriebenen Segmente"""
+
+    try:
+      with open(ziel+".hls","r") as fp:
+        state = json.load(fp)
+      if (state["playlist"] == playlist and
+          os.path.getsize(ziel) >= state["bytes"]):
+        os.truncate(ziel,state["bytes"])
+        return state["segmente"]
+    except (OSError,ValueError,KeyError):
+      pass
+    return 0
+
+  # ------------------------------------------------------------------------
+
+  def save_state(self,ziel,playlist,segmente,size):
+    """Stand nach einem kompletten Segment speichern"""
+
+    with open(ziel+".hls.tmp","w") as fp:
+      json.dump({"playlist": playlist, "segmente": segmente, "bytes": size},fp)
+    os.replace(ziel+".hls.tmp",ziel+".hls")
+
+  # ------------------------------------------------------------------------
+
+  def load(self,url,ziel,fortschritt=None):
+    """Ein Durchlauf: Playlist auflösen und alle fehlenden Segmente laden.
+       Fehler lösen eine Exception aus. fortschritt(geladen,erwartet) wird
+       nach jedem Segment aufgerufen, die erwartete Größe ist aus den schon
+       geladenen Segmenten hochgerechnet"""
+
+    playlist,segmente = self.get_segmente(url)
+    start = self.read_state(ziel,playlist)
+    if start:
+      Msg.msg("INFO","HLS-Download wird bei Segment %d von %d fortgesetzt" %
+              (start+1,len(segmente)))
+
+    futures = collections.deque()
+    index   = start
+    with ThreadPoolExecutor(self.parallel) as pool, \
+         open(ziel,"ab" if start else "wb",buffering=BUFSIZE) as fp:
+      try:
+        while futures or index < len(segmente):
+          # Fenster auffüllen
+          while index < len(segmente) and len(futures) < self.parallel:
+            futures.append(pool.submit(self.loader.get,segmente[index]))
+            index += 1
+          # ältestes Segment abwarten und anhängen
+          data,_ = futures.popleft().result()
+          fp.write(data)
+          fp.flush()
+          fertig = index-len(futures)
+          self.save_state(ziel,playlist,fertig,fp.tell())
+          if fortschritt:
+            fortschritt(fp.tell(),fp.tell()*len(segmente)//fertig)
+      except:
+        for future in futures:
+          future.cancel()
+        raise
+
+  # ------------------------------------------------------------------------
+
+  def download(self,url,ziel,fortschritt=None):
+    """Playlist laden und als eine Datei unter ziel speichern.
+       Ergebnis ist True bei Erfolg"""
+
+    try:
+      self.load(url,ziel,fortschritt)
+    except (http.client.HTTPException,OSError,ValueError) as ex:
+      Msg.msg("ERROR","HLS-Download %s fehlgeschlagen: %s" % (url,ex))
+      return False
+    os.remove(ziel+".hls")
+    return True
@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# --------------------------------------------------------------------------
+# Mediathekview auf der Kommandozeile
+#
+# Class HttpDownload: Download von Filmen ohne externes Programm
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/mtv_cli
+#
+# --------------------------------------------------------------------------
+
+import os, ssl, time, threading
+import http.client
+from urllib.parse import urlsplit, urljoin
+
+from mtv_const  import BUFSIZE
+from mtv_msg    import Msg as Msg
+
+class HttpStatusError(IOError):
+  """Dauerhafter Fehler (HTTP-Status 4xx), ein neuer Versuch ist sinnlos"""
+  pass
+
+class TokenBucket:
+  """Gemeinsame Obergrenze für die Bandbreite aller Downloads.
+
+     Jeder Thread meldet die gelesenen Bytes, bei Überschreitung der Rate
+     wartet er entsprechend. Der Vorrat reicht für höchstens eine Sekunde,
+     gelesen wird in Blöcken von höchstens einer Zehntelsekunde (chunk),
+     damit ein einzelner Block den Vorrat nicht übersteigt"""
+
+  # ------------------------------------------------------------------------
+
+  def __init__(self,rate):
+    """Constructor. rate in Bytes pro Sekunde"""
+    self.rate   = rate
+    self.tokens = rate
+    self.chunk  = max(1,min(BUFSIZE,rate//10))
+    self.stamp  = time.monotonic()
+    self.lock   = threading.Lock()
+
+  # ------------------------------------------------------------------------
+
+  def consume(self,n):
+    """n Bytes verbrauchen und falls nötig warten"""
+
+    with self.lock:
+      now         = time.monotonic()
+      self.tokens = min(self.rate,self.tokens + (now-self.stamp)*self.rate)
+      self.stamp  = now
+      self.tokens -= n
+      wait = -self.tokens/self.rate if self.tokens < 0 else 0
+    if wait:
+      time.sleep(wait)
+
+class HttpDownload:
+  """Download per HTTP(S) im eigenen Prozess.
+
+     Verbindungen bleiben offen (keep-alive) und werden pro Host für
+     weitere Filme wiederverwendet. Eine vorhandene Zieldatei wird per
+     Range-Request fortgesetzt. Bei Netzwerkfehlern und Serverfehlern (5xx)
+     gibt es bis zu retries weitere Versuche, jeweils ab dem schon
+     geschriebenen Stand. Mit rate (Bytes pro Sekunde) teilen sich alle
+     Downloads eine Obergrenze für die Bandbreite. Das Objekt kann von
+     mehreren Threads gleichzeitig verwendet werden"""
+
+  REDIRECTS = 5                         # max. Anzahl Weiterleitungen
+  RETRY_WAIT = 2                        # Sekunden vor dem ersten Wiederholen
+
+  # ------------------------------------------------------------------------
+
+  def __init__(self,timeout=60,retries=3,rate=0):
+    """Constructor. timeout gilt für Verbindungsaufbau und jedes Lesen,
+       rate=0 bedeutet keine Begrenzung"""
+    self.timeout = timeout
+    self.retries = retries
+    self.bucket  = TokenBucket(rate) if rate else None
+    self.context = ssl.create_default_context()
+    self.idle    = {}                   # (scheme,host,port) -> [Verbindung]
+    self.lock    = threading.Lock()
+
+  # ------------------------------------------------------------------------
+
+  def get_connection(self,key):
+    """Freie Verbindung zum Host aus dem Pool holen oder neu anlegen.
+       Ergebnis ist (Verbindung,wiederverwendet)"""
+
+    with self.lock:
+      if self.idle.get(key):
+        return self.idle[key].pop(),True
+    scheme,host,port = key
+    if scheme == "https":
+      return http.client.HTTPSConnection(host,port,timeout=self.timeout,
+                                         context=self.context),False
+    return http.client.HTTPConnection(host,port,timeout=self.timeout),False
+
+  # ------------------------------------------------------------------------
+
+  def release(self,key,conn,response):
+    """Verbindung nach komplett gelesener Antwort zurück in den Pool"""
+
+    if response.will_close:
+      conn.close()
+    else:
+      with self.lock:
+        self.idle.setdefault(key,[]).append(conn)
+
+  # ------------------------------------------------------------------------
+
+  def close(self):
+    """Alle freien Verbindungen schließen"""
+
+    with self.lock:
+      for conns in self.idle.values():
+        for conn in conns:
+          conn.close()
+      self.idle = {}
+
+  # ------------------------------------------------------------------------
+
+  def read_chunks(self,response):
+    """Antwort in Blöcken lesen, dabei die Bandbreite begrenzen"""
+
+    size = self.bucket.chunk if self.bucket else BUFSIZE
+    while True:
+      data = response.read(size)
+      if not data:
+        break
+      if self.bucket:
+        self.bucket.consume(len(data))
+      yield data
+
+  # ------------------------------------------------------------------------
+
+  def request(self,url,headers={},erlaubt=()):
+    """GET-Request absetzen, Weiterleitungen folgen. Eine Verbindung aus
+       dem Pool kann inzwischen vom Server geschlossen worden sein, dann
+       gibt es sofort einen zweiten Versuch mit einer neuen Verbindung.
+       Ein Status 4xx löst HttpStatusError aus, außer er steht in erlaubt.
+       Ergebnis ist (Pool-Schlüssel,Verbindung,Antwort,URL nach den
+       Weiterleitungen)"""
+
+    for _ in range(HttpDownload.REDIRECTS+1):
+      parts = urlsplit(url)
+      key   = (parts.scheme,parts.hostname,parts.port)
+      path  = (parts.path or "/") + ("?" + parts.query if parts.query else "")
+      while True:
+        conn,reused = self.get_connection(key)
+        try:
+          conn.request("GET",path,headers=headers)
+          response = conn.getresponse()
+          break
+        except (http.client.RemoteDisconnected,ConnectionError):
+          conn.close()
+          if not reused:
+            raise
+        except:
+          conn.close()
+          raise
+
+      if response.status in [301,302,303,307,308]:
+        location = response.getheader("Location")
+        response.read()
+        self.release(key,conn,response)
+        url = urljoin(url,location)
+        Msg.msg("DEBUG","Weiterleitung nach %s" % url)
+        continue
+      if 400 <= response.status < 500 and response.status not in erlaubt:
+        response.read()
+        self.release(key,conn,response)
+        raise HttpStatusError("HTTP-Status %d" % response.status)
+      return key,conn,response,url
+    raise IOError("Zu viele Weiterleitungen")
+
+  # ------------------------------------------------------------------------
+
+  def fetch(self,url,ziel,fortschritt=None):
+    """Ein Versuch: Datei laden bzw. fortsetzen. Fehler lösen eine
+       Exception aus. fortschritt(geladen,erwartet) wird nach jedem
+       geschriebenen Block aufgerufen"""
+
+    offset  = os.path.getsize(ziel) if os.path.exists(ziel) else 0
+    headers = {"Range": "bytes=%d-" % offset} if offset else {}
+    # 416 bei Range: Datei ist schon komplett
+    key,conn,response,_ = self.request(url,headers,(416,) if offset else ())
+    try:
+      if response.status == 416 and offset:
+        # Datei ist schon komplett (wie wget -c)
+        response.read()
+        mode = None
+      elif response.status == 206:
+        start = response.getheader("Content-Range","").split()[-1]
+        if not start.startswith("%d-" % offset):
+          raise IOError("Unerwarteter Bereich: %s" % start)
+        mode = "ab"
+      elif response.status == 200:
+        offset = 0                      # Server ignoriert Range
+        mode   = "wb"
+      else:
+        raise IOError("HTTP-Status %d" % response.status)
+
+      if mode:
+        length   = response.getheader("Content-Length")
+        expected = offset + int(length) if length else None
+        geladen  = offset
+        with open(ziel,mode,buffering=BUFSIZE) as fp:
+          for data in self.read_chunks(response):
+            fp.write(data)
+            geladen += len(data)
+            if fortschritt:
+              fortschritt(geladen,expected)
+        size = os.path.getsize(ziel)
+        if expected is not None and size < expected:
+          raise IOError("Download unvollständig (%d von %d Bytes)" %
+                        (size,expected))
+    except:
+      conn.close()
+      raise
+    self.release(key,conn,response)
+
+  # ------------------------------------------------------------------------
+
+  def read(self,url):
+    """Ein Versuch: Inhalt komplett lesen (Playlisten, Segmente).
+       Ergebnis ist (Daten,URL nach den Weiterleitungen)"""
+
+    key,conn,response,url = self.request(url)
+    try:
+      if response.status != 200:
+        raise IOError("HTTP-Status %d" % response.status)
+      length = response.getheader("Content-Length")
+      data   = b"".join(self.read_chunks(response))
+      if length and len(data) < int(length):
+        raise IOError("Download unvollständig (%d von %s Bytes)" %
+                      (len(data),length))
+    except:
+      conn.close()
+      raise
+    self.release(key,conn,response)
+    return data,url
+
+  # ------------------------------------------------------------------------
+
+  def retry(self,func,url,*args):
+    """func(url,*args) ausführen, bei Netzwerk- und Serverfehlern bis zu
+       retries mal wiederholen. Nach dem letzten Versuch und bei dauerhaften
+       Fehlern (HttpStatusError) wird die Exception weitergereicht"""
+
+    for versuch in range(self.retries+1):
+      if versuch:
+        time.sleep(HttpDownload.RETRY_WAIT * 2**(versuch-1))
+      try:
+        return func(url,*args)
+      except HttpStatusError:
+        raise
+      except (http.client.HTTPException,OSError) as ex:
+        Msg.msg("WARN","Download %s, Versuch %d fehlgeschlagen: %s" %
+                (url,versuch+1,ex))
+        if versuch == self.retries:
+          raise
+
+  # ------------------------------------------------------------------------
+
+  def get(self,url):
+    """Inhalt einer URL mit Wiederholungen lesen.
+       Ergebnis ist (Daten,URL nach den Weiterleitungen)"""
+    return self.retry(self.read,url)
+
+  # ------------------------------------------------------------------------
+
+  def download(self,url,ziel,fortschritt=None):
+    """Datei laden und unter ziel speichern. Ergebnis ist True bei Erfolg"""
+
+    try:
+      self.retry(self.fetch,url,ziel,fortschritt)
+      return True
+    except (http.client.HTTPException,OSError) as ex:
+      Msg.msg("ERROR","Download %s fehlgeschlagen: %s" % (url,ex))
+      return False
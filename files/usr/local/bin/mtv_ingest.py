@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# --------------------------------------------------------------------------
+# Mediathekview auf der Kommandozeile
+#
+# Import der Filmliste: Tokenizer und mehrstufige Pipeline
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/mtv_cli
+#
+# --------------------------------------------------------------------------
+
+# --- System-Imports   -----------------------------------------------------
+
+import os, re, json, time, datetime, queue, threading, types
+from multiprocessing import Pool
+
+# --- eigene Imports   ------------------------------------------------------
+
+from mtv_const    import BUFSIZE, INGEST_CHUNK, INGEST_QUEUE, STATS_INTERVAL
+from mtv_filmdb   import FilmDB as FilmDB
+from mtv_msg      import Msg as Msg
+
+# --- Kennzahlen des Imports   ---------------------------------------------
+
+class IngestStats:
+  """Kennzahlen des Imports (Mengen und Zeiten pro Phase). Die Kennzahlen
+     landen regelmäßig als JSON im Schlüssel _import der Status-Tabelle"""
+
+  PHASEN = ["lesen","parsen","schreiben","speichern"]
+
+  def __init__(self,download=None):
+    """Constructor"""
+    self.download       = download
+    self.start          = time.time()
+    self.status         = "läuft"
+    self.bytes_entpackt = 0
+    self.saetze         = 0
+    self.gefiltert      = 0
+    self.zeiten         = dict.fromkeys(IngestStats.PHASEN,0.0)
+    self.last_save      = time.time()
+
+  # ------------------------------------------------------------------------
+
+  def add_time(self,phase,start):
+    """Zeit seit start (perf_counter) zur Phase addieren"""
+    self.zeiten[phase] += time.perf_counter() - start
+
+  # ------------------------------------------------------------------------
+
+  def is_due(self):
+    """Prüfen, ob die Kennzahlen wieder gespeichert werden sollen"""
+    if time.time() - self.last_save < STATS_INTERVAL:
+      return False
+    self.last_save = time.time()
+    return True
+
+  # ------------------------------------------------------------------------
+
+  def as_json(self,filmDB):
+    """Kennzahlen als JSON-String zurückgeben"""
+    dauer = time.time() - self.start
+    return json.dumps({
+      "status":          self.status,
+      "start":           datetime.datetime.fromtimestamp(
+                           self.start).strftime("%d.%m.%Y %H:%M:%S"),
+      "dauer":           round(dauer,1),
+      "bytes_geladen":   self.download.bytes if self.download else 0,
+      "bytes_entpackt":  self.bytes_entpackt,
+      "saetze":          self.saetze,
+      "gefiltert":       self.gefiltert,
+      "eingefuegt":      filmDB.get_stored(),
+      "dubletten":       filmDB.get_error(),
+      "saetze_pro_s":    round(self.saetze/dauer) if dauer else 0,
+      "zeiten":          {k: round(v,1) for k,v in self.zeiten.items()}
+      },ensure_ascii=False)
+
+# --- Tokenizer für die Filmliste   ----------------------------------------
+
+class RecordReader:
+  """Liest die Filmliste streamend und liefert die Sätze ("X": [...])
+     einzeln als JSON-Array (Text) zurück.
+
+     Innerhalb von JSON-Strings ist jedes Anführungszeichen maskiert (\\"),
+     ein unmaskiertes "X" mit folgendem Doppelpunkt ist deshalb immer ein
+     Satzschlüssel. Bereits gelieferte Zeichen werden nicht erneut gescannt,
+     nur der unvollständige Satz am Pufferende wird mitgenommen."""
+
+  RE_KEY   = re.compile(r'"X"\s*:\s*')
+  RE_LISTE = re.compile(r'"Filmliste"\s*:\s*\[\s*"[^"]*"\s*,\s*"([^"]*)"')
+  KEY_MAX  = 16                    # max. Länge eines Schlüssels mit Blanks
+
+  def __init__(self,fpin,stats=None):
+    self.fpin      = fpin
+    self.stats     = stats or IngestStats()
+    self.buf_count = 0
+    self.datum     = None
+
+  def get_datum(self,kopf):
+    """Erstellungszeit der Liste (UTC, zweites Feld der ersten Kopfzeile)
+       als ISO-Zeitstempel. Ergebnis ist None, falls der Kopf keine enthält"""
+    match = self.RE_LISTE.search(kopf)
+    try:
+      datum = datetime.datetime.strptime(match.group(1),"%d.%m.%Y, %H:%M")
+    except (AttributeError,ValueError):
+      return None
+    return datum.replace(tzinfo=datetime.timezone.utc).isoformat()
+
+  def __iter__(self):
+    tail   = ""
+    resume = 0
+    header = True
+    while True:
+      # Buffer neu lesen
+      start = time.perf_counter()
+      chunk = self.fpin.read(BUFSIZE)
+      self.stats.add_time("lesen",start)
+      self.stats.bytes_entpackt += len(chunk.encode())
+      self.buf_count += 1
+      if not self.buf_count%100:
+        Msg.msg("INFO",'.',False)
+      data  = tail + chunk if tail else chunk
+
+      # Sätze zwischen zwei Schlüsseln ausgeben, der Kopf (Filmliste)
+      # vor dem ersten Schlüssel wird übersprungen
+      start = 0
+      for match in self.RE_KEY.finditer(data,resume):
+        if header:
+          header     = False
+          self.datum = self.get_datum(data[:match.start()])
+        else:
+          yield data[start:data.rfind("]",start,match.start())+1]
+        start = match.end()
+
+      # Verarbeitung Dateiende (verbliebenen Satz ausgeben)
+      if not chunk:
+        end = data.rfind("]",start)
+        if not header and end >= start:
+          yield data[start:end+1]
+        return
+
+      # unvollständigen Satz aufheben, nur das Ende erneut durchsuchen
+      tail   = data[start:]
+      resume = max(len(tail)-self.KEY_MAX,0)
+
+# --- Worker: Sätze parsen   ------------------------------------------------
+
+_filmDB = None
+
+def init_worker(config):
+  """Parser im Worker-Prozess anlegen. Der Parser braucht nur die
+     Konfiguration, eine Datenbank öffnet er nicht"""
+  global _filmDB
+
+  _filmDB = FilmDB(types.SimpleNamespace(config=config,dbfile=None))
+
+def parse_chunk(chunk):
+  """Einen Block von Sätzen in Tupel für die Datenbank umwandeln.
+     chunk ist ein Tupel (Sätze,[Sender,Thema]), der zweite Eintrag enthält
+     die Werte für leere Felder am Anfang des Blocks.
+     Ergebnis ist (Anzahl Sätze,Liste der Tupel,Laufzeit)"""
+
+  start = time.perf_counter()
+  records,seed = chunk
+  _filmDB.last_liste = seed
+  rows = []
+  for record in records:
+    film_info = _filmDB.rec2FilmInfo(record)
+    if film_info:
+      rows.append(_filmDB.get_row(film_info))
+  return len(records),rows,time.perf_counter()-start
+
+# --- Pipeline   ------------------------------------------------------------
+
+class Pipeline:
+  """Import in drei Stufen: ein Thread entpackt und zerlegt die Filmliste
+     in Blöcke, ein Prozess-Pool parst die Blöcke und der Aufrufer schreibt
+     die Ergebnisse als einziger in die Datenbank. Zwischen den Stufen
+     ist die Anzahl der Blöcke begrenzt (INGEST_QUEUE). Bei einem Fehler
+     brechen die Stufen 1 und 2 über das Event stop ab, sonst blieben der
+     Thread und der Pool beim Warten auf freie Plätze hängen."""
+
+  WAIT = 0.1                            # Sekunden zwischen zwei Prüfungen
+
+  # Sender und Thema am Satzanfang (noch JSON-kodiert)
+  RE_HEAD = re.compile(r'\[\s*"((?:[^"\\]|\\.)*)"\s*,\s*"((?:[^"\\]|\\.)*)"')
+
+  def __init__(self,fpin,filmDB,stats=None):
+    """Constructor"""
+    self.stats   = stats or IngestStats()
+    self.reader  = RecordReader(fpin,self.stats)
+    self.filmDB  = filmDB
+    self.workers = filmDB.config["NUM_WORKERS"] or os.cpu_count() or 1
+    self.queue   = queue.Queue(INGEST_QUEUE)
+    self.slots   = threading.Semaphore(INGEST_QUEUE)
+    self.stop    = threading.Event()
+    self.total   = 0
+    self.error   = None
+
+  # ------------------------------------------------------------------------
+
+  def get_seed(self,records,seed):
+    """Letzte nicht-leere Werte für Sender und Thema im Block suchen.
+       Leere Felder übernehmen im Parser den Wert des Vorgängers, deshalb
+       braucht der nächste Block diese Werte als Startwerte"""
+
+    found = [None,None]
+    for record in reversed(records):
+      match = self.RE_HEAD.match(record)
+      if not match:
+        continue
+      for i in range(2):
+        if found[i] is None and match.group(i+1):
+          found[i] = json.loads('"%s"' % match.group(i+1))
+      if None not in found:
+        break
+
+    if seed is None:
+      seed = ["",""]
+    return [found[i] if found[i] is not None else seed[i] for i in range(2)]
+
+  # ------------------------------------------------------------------------
+
+  def put_chunk(self,chunk):
+    """Block in die Queue stellen, sobald Platz ist. Ergebnis ist False,
+       falls die Pipeline inzwischen abgebrochen wurde"""
+
+    while not self.stop.is_set():
+      try:
+        self.queue.put(chunk,timeout=Pipeline.WAIT)
+        return True
+      except queue.Full:
+        pass
+    return False
+
+  # ------------------------------------------------------------------------
+
+  def read_chunks(self):
+    """Stufe 1: Filmliste lesen und in Blöcke aufteilen (eigener Thread)"""
+
+    try:
+      seed    = None
+      records = []
+      for record in self.reader:
+        records.append(record)
+        if len(records) == INGEST_CHUNK:
+          if not self.put_chunk((records,seed)):
+            return
+          seed    = self.get_seed(records,seed)
+          records = []
+      if records:
+        self.put_chunk((records,seed))
+    except Exception as ex:
+      self.error = ex
+    finally:
+      self.put_chunk(None)
+
+  # ------------------------------------------------------------------------
+
+  def get_chunks(self):
+    """Blöcke an Stufe 2 weitergeben, höchstens INGEST_QUEUE gleichzeitig.
+       Endet auch, sobald die Pipeline abgebrochen wird"""
+
+    while not self.stop.is_set():
+      try:
+        chunk = self.queue.get(timeout=Pipeline.WAIT)
+      except queue.Empty:
+        continue
+      if chunk is None:
+        return
+      while not self.slots.acquire(timeout=Pipeline.WAIT):
+        if self.stop.is_set():
+          return
+      yield chunk
+
+  # ------------------------------------------------------------------------
+
+  def write_rows(self,results):
+    """Stufe 3: Ergebnisse der Reihe nach in die Datenbank schreiben"""
+
+    for count,rows,dauer in results:
+      self.slots.release()
+      self.total += count
+      self.stats.saetze    += count
+      self.stats.gefiltert += count - len(rows)
+      self.stats.zeiten["parsen"] += dauer
+
+      start = time.perf_counter()
+      self.filmDB.insert_rows(rows)
+      self.stats.add_time("schreiben",start)
+      if self.stats.is_due():
+        self.filmDB.save_import_status(self.stats.as_json(self.filmDB))
+
+  # ------------------------------------------------------------------------
+
+  def run(self):
+    """Pipeline ausführen und Anzahl gelesener Sätze zurückgeben"""
+
+    Msg.msg("DEBUG","Anzahl Worker: %d" % self.workers)
+    config = self.filmDB.config
+    thread = threading.Thread(target=self.read_chunks,daemon=True)
+
+    if self.workers == 1:
+      # Spezialbehandlung (erleichtert Debugging)
+      init_worker(config)
+      thread.start()
+      try:
+        self.write_rows(map(parse_chunk,self.get_chunks()))
+      except:
+        self.stop.set()
+        raise
+    else:
+      # Pool vor dem Start des Threads erzeugen (fork). Der Abbruch muss
+      # vor dem Beenden des Pools erfolgen, terminate() wartet auf das
+      # Ende von get_chunks()
+      with Pool(self.workers,initializer=init_worker,
+                initargs=(config,)) as pool:
+        thread.start()
+        try:
+          self.write_rows(pool.imap(parse_chunk,self.get_chunks()))
+        except:
+          self.stop.set()
+          raise
+
+    thread.join()
+    if self.error:
+      raise self.error
+    return self.total
+
+  # ------------------------------------------------------------------------
+
+  def get_buf_count(self):
+    """Anzahl gelesener Buffer zurückgeben"""
+    return self.reader.buf_count
+
+  # ------------------------------------------------------------------------
+
+  def get_datum(self):
+    """Erstellungszeit der Liste (ISO, UTC) oder None zurückgeben"""
+    return self.reader.datum
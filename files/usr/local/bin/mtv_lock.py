@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# --------------------------------------------------------------------------
+# Mediathekview auf der Kommandozeile
+#
+# Sperren für schreibende Abläufe (Aktualisierung, Download)
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/mtv_cli
+#
+# --------------------------------------------------------------------------
+
+import fcntl, time
+
+LOCK_POLL = 0.5                       # Sekunden zwischen zwei Versuchen
+
+# --- Sperre anfordern   ----------------------------------------------------
+
+def get_lock(datei,rolle,timeout=0):
+  """Sperre für eine Rolle ("aktualisieren", "download") anfordern.
+     Nur Abläufe derselben Rolle schließen sich gegenseitig aus, Leser
+     brauchen keine Sperre (die Datenbank läuft im WAL-Modus). Die Sperre
+     ist eine eigene Datei neben der Datenbank. Es wird bis zu timeout
+     Sekunden gewartet. Ergebnis ist die offene Sperrdatei oder None"""
+
+  fd   = open("%s.%s.lock" % (datei,rolle),"a")
+  ende = time.time() + timeout
+  while True:
+    try:
+      fcntl.flock(fd,fcntl.LOCK_NB | fcntl.LOCK_EX)
+      return fd
+    except OSError:
+      if time.time() >= ende:
+        fd.close()
+        return None
+      time.sleep(LOCK_POLL)
+
+# --- Sperre freigeben   ----------------------------------------------------
+
+def release_lock(fd):
+  """Sperre freigeben"""
+  fcntl.flock(fd,fcntl.LOCK_UN)
+  fd.close()
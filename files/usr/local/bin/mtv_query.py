@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# --------------------------------------------------------------------------
+# Mediathekview auf der Kommandozeile
+#
+# Class FilmQuery: Suchausdrücke parsen und in SQL übersetzen
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/mtv_cli
+#
+# --------------------------------------------------------------------------
+
+from mtv_filminfo import fold
+
+class FilmQuery:
+  """Suchausdruck (Liste von Suchbegriffen) als Ausdrucksbaum.
+
+     Knoten des Baums sind Tupel:
+       ("and",[Knoten,...]), ("or",[Knoten,...])
+       ("text",Begriff)              generische Volltextsuche
+       ("feld",Spalte,Wert)          Spalte like %Wert% (siehe compile_feld)
+       ("datum",Operator,ISO-Datum)  Datum <,<=,>,>=,= Wert
+       ("bereich",von,bis)           Datum zwischen von und bis
+     Benutzereingaben landen nie im SQL-Text, sondern als Parameter.
+     Gleich aufgebaute Suchen ergeben deshalb denselben SQL-Text und
+     SQLite kann das übersetzte Statement wiederverwenden.
+
+     Ohne Operatoren werden generische Suchbegriffe mit "oder" und die Suche
+     in Feldern (sowie Klammern) mit "und" angehängt. Wie in SQL bindet
+     "und" stärker als "oder"."""
+
+  OPERATORS  = {"und": "and", "and": "and", "oder": "or", "or": "or"}
+  DATE_OPS   = {"<": "<", "<=": "<=", "=<": "<=", ">": ">", ">=": ">=",
+                "=>": ">=", "=": "="}
+  TEXT_COLS  = ["Sender","Thema","Titel","Beschreibung"]
+
+  SELECT     = "select %s from Filme"
+  FTS_SELECT = """select %s from filme_fts
+                    join Filme on Filme.rowid = filme_fts.rowid
+                  where filme_fts match ?
+                  order by bm25(filme_fts,%s)"""
+  FTS_WHERE  = "rowid in (select rowid from filme_fts where filme_fts match ?)"
+  FTS_COUNT  = "select count(*) from filme_fts where filme_fts match ?"
+
+  # ------------------------------------------------------------------------
+
+  def __init__(self,suche,columns,fts=False,weights="",folded=[]):
+    """Constructor. columns sind die Spalten des Ergebnisses und zugleich
+       die erlaubten Spalten für key:value, fts gibt an, ob der
+       Volltextindex filme_fts existiert, folded sind die Spalten mit
+       normalisierter Kopie (Spalte_n)"""
+
+    self.select  = ",".join(columns)
+    self.columns = {column.lower(): column for column in columns}
+    self.fts     = fts
+    self.weights = weights
+    self.folded  = folded
+    self.tree,_  = self.parse(list(suche),0,False)
+
+  # ------------------------------------------------------------------------
+
+  def parse(self,tokens,pos,nested):
+    """Suchbegriffe ab Position pos bis zur schließenden Klammer (nested)
+       bzw. bis zum Ende parsen. Ergebnis ist (Knoten,Position).
+       Fehlende Klammern und überzählige Operatoren werden ignoriert"""
+
+    operands = []
+    ops      = []
+    pending  = None
+    while pos < len(tokens):
+      token = tokens[pos]
+      pos  += 1
+      if token == ")":
+        if nested:
+          break
+        continue
+      if token in FilmQuery.OPERATORS:
+        pending = FilmQuery.OPERATORS[token]
+        continue
+      if token == "(":
+        node,pos = self.parse(tokens,pos,True)
+        if not node:
+          continue
+      else:
+        node = self.parse_term(token)
+
+      if operands:
+        ops.append(pending or ("or" if node[0] == "text" else "and"))
+      operands.append(node)
+      pending = None
+
+    if not operands:
+      return None,pos
+
+    # "und" vor "oder": Folgen von und-Verknüpfungen zusammenfassen
+    groups = [[operands[0]]]
+    for op,node in zip(ops,operands[1:]):
+      if op == "and":
+        groups[-1].append(node)
+      else:
+        groups.append([node])
+    return self.join("or",[self.join("and",g) for g in groups]),pos
+
+  # ------------------------------------------------------------------------
+
+  def join(self,op,nodes):
+    """Knoten verknüpfen, gleiche Operatoren werden zusammengefasst"""
+
+    if len(nodes) == 1:
+      return nodes[0]
+    children = []
+    for node in nodes:
+      if node[0] == op:
+        children.extend(node[1])
+      else:
+        children.append(node)
+    return (op,children)
+
+  # ------------------------------------------------------------------------
+
+  def parse_term(self,token):
+    """Einzelnen Suchbegriff in einen Knoten umwandeln. Begriffe mit
+       unbekanntem Schlüssel gelten als generische Suchbegriffe"""
+
+    if ':' in token:
+      key,value = token.split(":",1)
+      column = self.columns.get(key.lower())
+      if column == "Datum":
+        return self.parse_datum(value)
+      elif column:
+        return ("feld",column,value)
+    return ("text",token)
+
+  # ------------------------------------------------------------------------
+
+  def parse_datum(self,value):
+    """datum:=xxx, datum:>xxx, datum:>=xxx usw., datum:start-end und
+       datum:xxx (identisch zu datum:=xxx)"""
+
+    op = value[0:2] if value[0:2] in FilmQuery.DATE_OPS else value[0:1]
+    if op in FilmQuery.DATE_OPS:
+      return ("datum",FilmQuery.DATE_OPS[op],iso_date(value[len(op):]))
+    elif "-" in value:
+      limits = value.split("-")
+      return ("bereich",iso_date(limits[0]),iso_date(limits[1]))
+    else:
+      return ("datum","=",iso_date(value))
+
+  # ------------------------------------------------------------------------
+
+  def get_match(self,token):
+    """Generischen Suchbegriff in einen FTS5-Ausdruck umwandeln: die Wörter
+       bilden eine Phrase, das letzte Wort darf ein Präfix sein. Ergebnis
+       ist None, falls der Begriff keine Wörter enthält"""
+
+    if not any(c.isalnum() for c in token):
+      return None
+    words = [word.replace('"','""') for word in token.split()]
+    return '"%s" *' % " ".join(words)
+
+  # ------------------------------------------------------------------------
+
+  def is_fulltext(self,node):
+    """Prüfen, ob der Baum nur aus generischen Suchbegriffen besteht, die
+       der Volltextindex beantworten kann"""
+
+    if node[0] in ["and","or"]:
+      return all(self.is_fulltext(child) for child in node[1])
+    return node[0] == "text" and self.get_match(node[1]) is not None
+
+  # ------------------------------------------------------------------------
+
+  def compile_match(self,node):
+    """Baum in einen FTS5-Ausdruck übersetzen"""
+
+    if node[0] == "text":
+      return self.get_match(node[1])
+    op = " %s " % node[0].upper()
+    return "(%s)" % op.join(self.compile_match(child) for child in node[1])
+
+  # ------------------------------------------------------------------------
+
+  def compile(self,node,params):
+    """Baum in eine SQL-Bedingung übersetzen, Werte an params anhängen"""
+
+    kind = node[0]
+    if kind in ["and","or"]:
+      op = " %s " % kind
+      return "(%s)" % op.join(self.compile(child,params) for child in node[1])
+    elif kind == "text":
+      match = self.get_match(node[1]) if self.fts else None
+      if match:
+        params.append(match)
+        return FilmQuery.FTS_WHERE
+      params.extend(len(FilmQuery.TEXT_COLS)*["%%%s%%" % node[1]])
+      return "(%s)" % " or ".join("%s like ?" % column
+                                  for column in FilmQuery.TEXT_COLS)
+    elif kind == "feld":
+      return self.compile_feld(node[1],node[2],params)
+    elif kind == "datum":
+      params.append(node[2])
+      return "Datum %s ?" % node[1]
+    else:
+      params.extend(node[1:])
+      return "Datum between ? and ?"
+
+  # ------------------------------------------------------------------------
+
+  def compile_feld(self,column,value,params):
+    """Suche in einer Spalte übersetzen. Ein * steht für beliebige Zeichen.
+       Für Spalten mit normalisierter Kopie (ohne Groß-/Kleinschreibung und
+       Akzente) gilt: sender:xxx ist exakt, xxx* ein Präfix, sonst Teilstring.
+       Exakte und Präfix-Suchen nutzen den Index der Kopie"""
+
+    if column not in self.folded:
+      params.append("%%%s%%" % value.replace("*","%"))
+      return "%s like ?" % column
+
+    column += "_n"
+    value   = fold(value).replace("*","%")
+    prefix  = value[:-1]
+    if value.endswith("%") and prefix and not any(c in prefix for c in "%_"):
+      params.extend([prefix,prefix+chr(0x10FFFF)])
+      return "(%s >= ? and %s < ?)" % (column,column)
+    elif "%" in value:
+      params.append(value)
+      return "%s like ?" % column
+    elif column == "Sender_n":
+      params.append(value)
+      return "%s = ?" % column
+    params.append("%%%s%%" % value)
+    return "%s like ?" % column
+
+  # ------------------------------------------------------------------------
+
+  def get_sql(self):
+    """SQL-Statement und Parameter (Tupel) zurückgeben. Suchen nur mit
+       generischen Suchbegriffen laufen über den Volltextindex und sind
+       nach Relevanz sortiert"""
+
+    select = FilmQuery.SELECT % self.select
+    if not self.tree:
+      return select,()
+    if self.fts and self.is_fulltext(self.tree):
+      columns = ",".join("Filme."+c for c in self.columns.values())
+      return (FilmQuery.FTS_SELECT % (columns,self.weights),
+              (self.compile_match(self.tree),))
+    where,params = self.get_where()
+    return "%s where %s" % (select,where),params
+
+  # ------------------------------------------------------------------------
+
+  def get_count_sql(self):
+    """SQL-Statement und Parameter (Tupel) für die Anzahl der Treffer.
+       Anders als bei get_sql() entfällt die Sortierung nach Relevanz"""
+
+    if self.fts and self.tree and self.is_fulltext(self.tree):
+      return FilmQuery.FTS_COUNT,(self.compile_match(self.tree),)
+    where,params = self.get_where()
+    if not where:
+      return FilmQuery.SELECT % "count(*)",()
+    return "%s where %s" % (FilmQuery.SELECT % "count(*)",where),params
+
+  # ------------------------------------------------------------------------
+
+  def get_where(self):
+    """Nur die Bedingung und die Parameter (Tupel) zurückgeben. Ohne
+       Suchbegriffe ist die Bedingung None"""
+
+    if not self.tree:
+      return None,()
+    params = []
+    where  = self.compile(self.tree,params)
+    return where,tuple(params)
+
+# --- Deutsches Datum in ISO-Datum umwandeln   -------------------------------
+
+def iso_date(datum):
+  """Deutsches Datum (TT.MM.JJ oder TT.MM.JJJJ) in ISO-Datum umwandeln"""
+  parts=datum.split(".")
+  return ("20" if len(parts[2]) == 2 else "") + \
+         parts[2] + "-" + parts[1] + "-" + parts[0]
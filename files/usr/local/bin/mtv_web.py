@@ -14,7 +14,7 @@
 
 # --- System-Imports   ------------------------------------------------------
 
-import os, json, subprocess
+import os, json, time, subprocess
 from argparse import ArgumentParser
 from multiprocessing import Process
 import configparser
@@ -27,6 +27,7 @@ from bottle import route
 import mtv_cli
 from mtv_const    import FILME_SQLITE, MTV_CLI_HOME
 from mtv_filmdb   import FilmDB as FilmDB
+from mtv_cache    import SuchCache
 from mtv_msg      import Msg as Msg
 from mtv_download import download_filme
 
@@ -72,52 +73,162 @@ def main_page():
 def status():
   result = {"_akt": "00.00.0000", "_anzahl": "0" }
   try:
-    rows =  options.filmDB.read_status(['_akt','_anzahl'])
+    rows =  options.filmDB.read_status(['_akt','_anzahl','_import',
+                                        '_neu','_geaendert','_geloescht'])
     for row in rows:
       key    = row['key']
       if key == "_akt":
         tstamp = row['Zeit'].strftime("%d.%m.%Y %H:%M:%S")
         result[key] = tstamp
+      elif key == "_import":
+        # Kennzahlen des (laufenden) Imports
+        result[key] = json.loads(row['text'])
+        result[key]['zeit'] = row['Zeit'].strftime("%d.%m.%Y %H:%M:%S")
       else:
         text   = row['text']
         result[key] = text
   except:
     pass
+  result["_cache"] = options.cache.get_stats()
   Msg.msg("DEBUG","Status: " + str(result))
   bottle.response.content_type = 'application/json'
   return json.dumps(result)
 
 # --- Suche   ---------------------------------------------------------------
 
-@route('/suche',method='POST')
-def suche():
-  # Auslesen Request-Parameter
+def get_such_args():
+  """Suchbegriffe aus den Request-Parametern lesen. Rohes SQL ist nur auf
+     der Kommandozeile erlaubt"""
   such_args = []
   token = bottle.request.forms.getunicode("global")
+  if token and token.strip().lower().startswith("select"):
+    bottle.abort(400,"Rohes SQL ist im Webinterface nicht erlaubt")
   if token:
     such_args.append(token)
-  for arg in ['sender','thema','datum','titel','bechreibung']:
+  for arg in ['sender','thema','datum','titel','beschreibung']:
     token = bottle.request.forms.getunicode(arg)
     if token:
       such_args.append(arg+':'+token)
   Msg.msg("DEBUG","Suchbegriffe: " + str(such_args))
+  return such_args
 
-  # Film-DB abfragen
-  statement = options.filmDB.get_query(such_args)
-  rows = options.filmDB.execute_query(statement)
+def get_int_arg(name,default,maximum):
+  """Ganzzahligen Request-Parameter lesen und auf 0..maximum begrenzen"""
+  try:
+    value = int(bottle.request.forms.get(name,default))
+  except ValueError:
+    bottle.abort(400,"Ungültiger Wert für %s" % name)
+  return max(0,min(value,maximum))
 
-  # Ergebnis aufbereiten
-  result = []
-  for row in rows:
-    item = {}
-    item['DATUM'] = row['DATUM'].strftime("%d.%m.%y")
-    for key in ['SENDER','THEMA','TITEL','DAUER','BESCHREIBUNG','_ID']:
-      item[key] = row[key]
-    result.append(item)
+@route('/suche',method='POST')
+def suche():
+  # Auslesen Request-Parameter
+  such_args = get_such_args()
+
+  # Film-DB abfragen, immer nur eine Seite (die Tabelle im Client fordert
+  # die Seiten einzeln an, wenn sie angezeigt werden)
+  suche_limit = options.config["SUCHE_LIMIT"]
+  offset = get_int_arg("offset",0,2**62)
+  limit  = get_int_arg("limit",suche_limit,suche_limit)
+  draw   = get_int_arg("draw",0,2**31)
+  statement,params = options.filmDB.get_query(such_args)
+  bottle.response.content_type = 'application/json'
 
-  Msg.msg("DEBUG","Anzahl Treffer: %d" % len(result))
+  # Ergebnis aus dem Cache, falls die Filmliste seither unverändert ist.
+  # Die Anzahl Treffer wird einmal pro Suche gezählt, ihr Eintrag zählt
+  # nicht für die Trefferquote (sonst zählte jede Anfrage doppelt)
+  cache_key  = (statement,params,limit,offset)
+  generation = get_generation()
+  options.cache.set_generation(generation)
+  anzahl = options.cache.get((statement,params),statistik=False)
+  if anzahl is None:
+    anzahl = str(options.filmDB.count_query(such_args))
+    options.cache.put((statement,params),anzahl,generation)
+  kopf = '{"draw": %d, "recordsTotal": %s, "recordsFiltered": %s, "data": ' % (
+    draw,anzahl,anzahl)
+
+  result = options.cache.get(cache_key)
+  if result is not None:
+    Msg.msg("DEBUG","Suchergebnis aus dem Cache")
+    return kopf + result + "}"
+  rows = options.filmDB.iter_query(statement,params,limit,offset)
+
+  # Ergebnis satzweise aufbereiten und als JSON-Liste streamen. Gemessen
+  # wird nur die Zeit für das Lesen der Sätze, nicht die Übertragung
+  def get_result():
+    yield kopf
+    parts = ["["]
+    yield parts[0]
+    zeit  = 0.0
+    start = time.perf_counter()
+    for row in rows:
+      zeit += time.perf_counter() - start
+      item = {}
+      item['DATUM'] = row['DATUM'].strftime("%d.%m.%y")
+      for key in ['SENDER','THEMA','TITEL','DAUER','BESCHREIBUNG','_ID']:
+        item[key] = row[key]
+      parts.append((",%s" if len(parts) > 1 else "%s") % json.dumps(item))
+      yield parts[-1]
+      start = time.perf_counter()
+    zeit += time.perf_counter() - start
+    log_slow_query(statement,params,limit,offset,len(parts)-1,zeit)
+    parts.append("]")
+    yield parts[-1] + "}"
+    Msg.msg("DEBUG","Anzahl Treffer (ab %d): %d" % (offset,len(parts)-2))
+    options.cache.put(cache_key,"".join(parts),generation)
+
+  return get_result()
+
+# --- Facetten (Anzahl Filme pro Sender, Thema und Tag)   -------------------
+
+@route('/facetten',method='POST')
+def facetten():
+  # Ohne Suchbegriffe die vorberechneten Zahlen (Themen nur für den Sender
+  # im Parameter themen), sonst Zählung über die Treffer der Suche
+  such_args = get_such_args()
+  themen    = bottle.request.forms.getunicode("themen")
   bottle.response.content_type = 'application/json'
-  return json.dumps(result)
+
+  cache_key  = ("facetten",tuple(such_args),themen)
+  generation = get_generation()
+  options.cache.set_generation(generation)
+  result = options.cache.get(cache_key)
+  if result is not None:
+    return result
+
+  if such_args:
+    counts = options.filmDB.count_facetten(such_args)
+  else:
+    counts = options.filmDB.read_facetten(themen)
+  result = json.dumps({
+    "SENDER": [{"SENDER": s, "ANZAHL": n} for s,n in counts["sender"]],
+    "THEMA":  [{"SENDER": s, "THEMA": t, "ANZAHL": n}
+                                         for s,t,n in counts["thema"]],
+    "DATUM":  [{"DATUM": d.strftime("%d.%m.%y"), "ANZAHL": n}
+                                         for d,n in counts["datum"]]})
+  options.cache.put(cache_key,result,generation)
+  return result
+
+# --- Langsame Suchen protokollieren   --------------------------------------
+
+def log_slow_query(statement,params,limit,offset,treffer,zeit):
+  """Suche mit Ausführungsplan protokollieren, falls sie länger als
+     SLOW_QUERY Millisekunden gedauert hat (0: aus)"""
+
+  schwelle = options.config["SLOW_QUERY"]
+  if not schwelle or zeit*1000 < schwelle:
+    return
+  statement,params = options.filmDB.get_page(statement,params,limit,offset)
+  plan = options.filmDB.get_plan(statement,params)
+  Msg.msg("WARN","Langsame Suche (%d ms, %d Treffer): %s, Parameter: %r, Plan: %s"
+          % (zeit*1000,treffer," ".join(statement.split()),params,
+             " | ".join(line.strip() for line in plan)))
+
+# --- Stand der Filmliste (für den Cache)   ---------------------------------
+
+def get_generation():
+  rows = options.filmDB.read_status(['_akt'])
+  return rows[0]['Zeit'] if rows else None
 
 # --- Downloads   -----------------------------------------------------------
 
@@ -135,14 +246,43 @@ def downloads():
     item = {}
     item['DATUM']       = row['DATUM'].strftime("%d.%m.%y")
     item['DATUMSTATUS'] = row['DATUMSTATUS'].strftime("%d.%m.%y")
-    for key in ['STATUS','SENDER','THEMA','TITEL','DAUER','_ID']:
+    for key in ['STATUS','SENDER','THEMA','TITEL','DAUER','_ID','PRIO',
+                'GELADEN','ERWARTET','RATE','ETA']:
       item[key] = row[key]
+    if row['ZEITFORTSCHRITT']:
+      item['ZEITFORTSCHRITT'] = row['ZEITFORTSCHRITT'].strftime("%d.%m.%y %H:%M:%S")
+    else:
+      item['ZEITFORTSCHRITT'] = None
     result.append(item)
 
   Msg.msg("DEBUG","Anzahl Einträge in Downloadliste: %d" % len(result))
   bottle.response.content_type = 'application/json'
   return json.dumps(result)
 
+# --- Treffer der Abos   ----------------------------------------------------
+
+@route('/treffer',method='POST')
+def treffer():
+  # Film-DB abfragen (optional nur ein Abo bzw. nur neue Treffer)
+  name = bottle.request.forms.getunicode("abo")
+  neu  = bottle.request.forms.get("neu") == "1"
+  rows = options.filmDB.read_treffer(name,neu)
+
+  # Liste aufbereiten
+  result = []
+  for row in rows:
+    item = {}
+    item['DATUM']    = row['DATUM'].strftime("%d.%m.%y")
+    item['GEFUNDEN'] = row['GEFUNDEN'].strftime("%d.%m.%y %H:%M")
+    item['NEU']      = not row['GEMELDET']
+    for key in ['ABO','SENDER','THEMA','TITEL','DAUER','BESCHREIBUNG','_ID']:
+      item[key] = row[key]
+    result.append(item)
+
+  Msg.msg("DEBUG","Anzahl Treffer der Abos: %d" % len(result))
+  bottle.response.content_type = 'application/json'
+  return json.dumps(result)
+
 # --- Dateien   -------------------------------------------------------------
 
 @route('/dateien',method='POST')
@@ -269,13 +409,28 @@ def vormerken():
     inserts.append((id,dates[i],'V'))
     i += 1
   Msg.msg("DEBUG","inserts: " + str(inserts))
-  changes = options.filmDB.save_downloads(inserts)
+  prio = int(bottle.request.forms.get('prio') or 0)
+  changes = options.filmDB.save_downloads(inserts,prio)
   Msg.msg("DEBUG","changes: " + str(changes))
 
   bottle.response.content_type = 'application/json'
   msg = '"%d von %d Filme vorgemerkt für den Download"' % (changes,len(ids))
   return '{"msg": ' + msg +'}'
 
+# --- Priorität vorgemerkter Filme ändern   --------------------------------
+
+@route('/prio',method='POST')
+def prio():
+  # Auslesen Request-Parameter
+  ids  = bottle.request.forms.get('ids').split(" ")
+  prio = int(bottle.request.forms.get('prio') or 0)
+  Msg.msg("DEBUG","IDs: " + str(ids))
+
+  changes = options.filmDB.update_prio([(id,) for id in ids],prio)
+  bottle.response.content_type = 'application/json'
+  msg = '"Priorität von %d vorgemerkten Filmen geändert"' % changes
+  return '{"msg": ' + msg +'}'
+
 # --- Aktualisieren   -------------------------------------------------------
 
 @route('/aktualisieren',method='GET')
@@ -338,6 +493,9 @@ def get_config(parser,config):
   else:
     config["PORT"] = 8026
     config["HOST"] = "0.0.0.0"
+  config["SUCHE_LIMIT"] = parser.getint('WEB',"SUCHE_LIMIT",fallback=500)
+  config["CACHE_SIZE"]  = parser.getint('WEB',"CACHE_SIZE",fallback=16)
+  config["SLOW_QUERY"]  = parser.getint('WEB',"SLOW_QUERY",fallback=0)
 
 # --- Hauptprogramm   -------------------------------------------------------
 
@@ -364,8 +522,10 @@ if __name__ == '__main__':
 
   # Globale Objekte anlegen
   options.upd_src = "auto"
+  options.upd_inkr = False
   options.config = config
   options.filmDB = FilmDB(options)
+  options.cache  = SuchCache(config["CACHE_SIZE"]*1024*1024)
 
   # Server starten
   WEB_ROOT = get_webroot(__file__)
@@ -375,3 +535,4 @@ if __name__ == '__main__':
     bottle.run(host='localhost', port=config["PORT"], debug=True,reloader=True)
   else:
     bottle.run(host=config["HOST"], port=config["PORT"], debug=False,reloader=False)
+  options.filmDB.shutdown()
@@ -16,6 +16,15 @@
   $(document).ready(function() {
       $("#film_liste").DataTable( {
         select: {style: 'multi'},
+        serverSide: true,
+        processing: true,
+        ordering: false,
+        searching: false,
+        deferLoading: 0,
+        pageLength: 50,
+        lengthMenu: [25, 50, 100, 250, 500],
+        rowId: "_ID",
+        ajax: ladeSeite,
         createdRow: function ( row, data, index ) {
             $("td:nth-child(5)", row).attr("title", data.BESCHREIBUNG);
         },
@@ -49,7 +58,8 @@
             { data: "DAUER", title: "Dauer" },
             { data: "TITEL", title: "Titel" }
         ]
-      });
+      }).on('select deselect', merkeAuswahl)
+        .on('draw', zeigeAuswahl);
   });
 </script>
 
@@ -16,6 +16,11 @@
   $(document).ready(function() {
       $("#vormerk_liste").DataTable( {
         select: {style: 'multi'},
+        createdRow: function ( row, data, index ) {
+            if (data.ZEITFORTSCHRITT) {
+              $("td:nth-child(8)", row).attr("title", "Stand: " + data.ZEITFORTSCHRITT);
+            }
+        },
         language: {
           "sEmptyTable":      "Keine Daten in der Tabelle vorhanden",
           "sInfo":            "_START_ bis _END_ von _TOTAL_ Einträgen",
@@ -46,7 +51,12 @@
             { data: "THEMA", title: "Thema" },
             { data: "DATUM", title: "Datum" },
             { data: "DAUER", title: "Dauer" },
-            { data: "TITEL", title: "Titel" }
+            { data: "TITEL", title: "Titel" },
+            { data: null,    title: "Fortschritt",
+              render: function(data,type,raw,meta) {
+                   return formatFortschritt(data);
+              }
+             }
         ]
       });
   });
@@ -24,6 +24,22 @@
           <td>Anzahl Filme</td>
           <td id="status_anzahl"></td>
         </tr>
+        <tr>
+          <td>Import</td>
+          <td id="status_import"></td>
+        </tr>
+        <tr>
+          <td>Import Sätze</td>
+          <td id="status_import_saetze"></td>
+        </tr>
+        <tr>
+          <td>Import Zeiten</td>
+          <td id="status_import_zeiten"></td>
+        </tr>
+        <tr>
+          <td>Such-Cache</td>
+          <td id="status_cache"></td>
+        </tr>
       </table>
   </div>         <!-- id=status -->
 </div>        <!-- id=content_status   -->
@@ -33,20 +33,60 @@ showPart=function(id) {
   Filme suchen
 */
 
+var sucheForm = null;
+var filmAuswahl = {};
+
 sucheFilme=function() {
+  // Die Tabelle holt die Treffer seitenweise vom Server, und zwar nur die
+  // Seite, die gerade angezeigt wird. Eine neue Suche verwirft die Auswahl.
+  var table   = $('#film_liste').DataTable();
+  table.rows().deselect();
+  sucheForm   = $("#form_suche").serialize();
+  filmAuswahl = {};
+  table.page(0).draw(false);
+  showPart("#content_filme");
+  return false;
+};
+
+/**
+  Eine Seite der Treffer laden (ajax-Funktion der Tabelle)
+*/
+
+ladeSeite=function(request, callback, settings) {
+  if (sucheForm == null) {
+    callback({draw: request.draw, recordsTotal: 0,
+              recordsFiltered: 0, data: []});
+    return;
+  }
   $.ajax({
     type: "POST",
-    data : $("#form_suche").serialize(),
+    data : sucheForm + "&draw=" + request.draw + "&offset=" + request.start +
+           "&limit=" + request.length,
     cache: false,
     url: "/suche",
-    success: function(data){
-      showPart("#content_filme");
-      var table = $('#film_liste').DataTable();
-      table.clear();
-      table.rows.add(data).draw();
+    success: callback
+  });
+};
+
+/**
+  Auswahl über alle Seiten merken (die Tabelle kennt nur die aktuelle Seite)
+*/
+
+merkeAuswahl=function(e, dt, type, indexes) {
+  dt.rows(indexes).every(function() {
+    var film = this.data();
+    if (e.type == "select") {
+      filmAuswahl[film._ID] = film.DATUM;
+    } else {
+      delete filmAuswahl[film._ID];
     }
   });
-   return false;
+};
+
+zeigeAuswahl=function() {
+  $('#film_liste').DataTable().rows(function(index, film) {
+    return film._ID in filmAuswahl;
+  }).select();
 };
 
 /**
@@ -70,21 +110,16 @@ updateListe=function() {
 */
 
 saveSelected=function() {
-  var table = $('#film_liste').DataTable();
-  var auswahl = table.rows({selected: true}).data();
   var ids, dates;
 
-  // ID und Datum aus ausgewählten Zeilen extrahieren ...
-  for (i=0; i< auswahl.length; ++i) {
+  // ID und Datum der ausgewählten Filme (aller Seiten) ...
+  for (var id in filmAuswahl) {
     if (ids) {
-      ids = ids + " " + auswahl[i]._ID;
+      ids = ids + " " + id;
+      dates = dates + " " + filmAuswahl[id];
     } else {
-      ids = auswahl[i]._ID;
-    }
-    if (dates) {
-      dates = dates + " " + auswahl[i].DATUM;
-    } else {
-      dates = auswahl[i].DATUM;
+      ids = id;
+      dates = filmAuswahl[id];
     }
   }
 
@@ -105,6 +140,8 @@ saveSelected=function() {
   Downloads suchen
 */
 
+var downloadTimer = null;
+
 sucheDownloads=function() {
   $.ajax({
     type: "POST",
@@ -112,14 +149,87 @@ sucheDownloads=function() {
     url: "/downloads",
     success: function(data){
       showPart("#content_liste");
-      var table = $('#vormerk_liste').DataTable();
-      table.clear();
-      table.rows.add(data).draw();
+      zeigeDownloads(data);
     }
   });
    return false;
 };
 
+/**
+  Downloadliste neu laden, solange sie angezeigt wird
+*/
+
+aktualisiereDownloads=function() {
+  downloadTimer = null;
+  if (!$("#content_liste").is(":visible")) {
+    return;
+  }
+  $.ajax({
+    type: "POST",
+    cache: false,
+    url: "/downloads",
+    success: function(data){
+      zeigeDownloads(data);
+    }
+  });
+};
+
+/**
+  Downloadliste anzeigen (Auswahl bleibt erhalten). Bei aktiven Downloads
+  wird die Liste alle 5 Sekunden aktualisiert
+*/
+
+zeigeDownloads=function(data) {
+  var table   = $('#vormerk_liste').DataTable();
+  var auswahl = table.rows({selected: true}).data().pluck("_ID").toArray();
+  table.clear();
+  table.rows.add(data).draw(false);
+  table.rows(function(idx,row,node) {
+    return auswahl.indexOf(row._ID) >= 0;
+  }).select();
+
+  if (downloadTimer) {
+    clearTimeout(downloadTimer);
+    downloadTimer = null;
+  }
+  if ($.grep(data,function(row) { return row.STATUS == "A"; }).length) {
+    downloadTimer = setTimeout(aktualisiereDownloads,5000);
+  }
+};
+
+/**
+  Fortschritt eines Downloads formatieren
+*/
+
+formatBytes=function(bytes) {
+  if (bytes >= 1073741824) {
+    return (bytes/1073741824).toFixed(1) + " GB";
+  }
+  return Math.round(bytes/1048576) + " MB";
+};
+
+formatFortschritt=function(row) {
+  if (row.GELADEN == null) {
+    return "";
+  }
+  var text = formatBytes(row.GELADEN);
+  if (row.ERWARTET) {
+    text += " von " + formatBytes(row.ERWARTET) + " (" +
+      Math.min(100,Math.floor(100*row.GELADEN/row.ERWARTET)) + "%)";
+  }
+  if (row.STATUS == "A") {
+    if (row.RATE != null) {
+      text += ", " + Math.round(row.RATE/1024) + " KB/s";
+    }
+    if (row.ETA != null) {
+      var min = Math.floor(row.ETA/60);
+      text += ", noch " + (min >= 60 ? Math.floor(min/60) + " h " : "") +
+        (min % 60) + " min";
+    }
+  }
+  return text;
+};
+
 /**
   Dateiliste anzeigen
 */
@@ -225,6 +335,25 @@ showStatus=function() {
         showPart("#content_status");
         $("#status_akt").text(data._akt);
         $("#status_anzahl").text(data._anzahl);
+        if (data._import) {
+          var imp = data._import;
+          $("#status_import").text(imp.status + " (Start: " + imp.start +
+            ", Dauer: " + imp.dauer + "s, Stand: " + imp.zeit + ")");
+          $("#status_import_saetze").text(imp.saetze + " gelesen, " +
+            imp.gefiltert + " gefiltert, " + imp.eingefuegt +
+            " gespeichert, " + imp.dubletten + " Dubletten (" +
+            imp.saetze_pro_s + "/s, " +
+            Math.round(imp.bytes_geladen/1048576) + " MB geladen, " +
+            Math.round(imp.bytes_entpackt/1048576) + " MB entpackt)");
+          $("#status_import_zeiten").text($.map(imp.zeiten,
+            function(v,k) { return k + ": " + v + "s"; }).join(", "));
+        }
+        if (data._cache) {
+          var c = data._cache;
+          $("#status_cache").text(c.treffer + " Treffer, " + c.fehlend +
+            " Fehlschläge, " + c.eintraege + " Einträge (" +
+            Math.round(c.groesse/1024) + " KB)");
+        }
     });
 };
 
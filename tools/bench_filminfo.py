@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# --------------------------------------------------------------------------
+# Mediathekview auf der Kommandozeile
+#
+# Micro-Benchmark für FilmInfo: Kosten pro Satz (Zeit und Speicher)
+#
+# Aufruf: tools/bench_filminfo.py [Anzahl Sätze]
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/mtv_cli
+#
+# --------------------------------------------------------------------------
+
+import sys, os, json, time, datetime, random, tracemalloc
+
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                               "..","files","usr","local","bin"))
+from mtv_filminfo import FilmInfo
+
+# --- Testdaten erzeugen   ---------------------------------------------------
+
+def get_records(anzahl):
+  """Rohe Sätze wie vom JSON-Parser (ca. 30 Tage, wenige Sender/Themen).
+     Der Umweg über JSON erzeugt wie beim Import eigene String-Objekte"""
+  random.seed(42)
+  today  = datetime.date.today()
+  sender = ["ARD","ZDF","3Sat","arte.de","BR","NDR","WDR","SWR"]
+  result = []
+  for i in range(anzahl):
+    datum = today - datetime.timedelta(days=random.randint(0,30))
+    dauer = "00:%02d:%02d" % (random.randint(0,59),random.randint(0,59))
+    result.append(json.loads(json.dumps([random.choice(sender),
+                   "Thema %d" % random.randint(0,200),
+                   "Titel %d" % i,
+                   datum.strftime("%d.%m.%Y"),"20:15:00",dauer,"512",
+                   "Beschreibung %d" % i,"https://cdn.example/%d.mp4" % i,
+                   "https://www.example/%d" % i,"","","35|k.mp4","",
+                   "35|hd.mp4","","1500000000","","DE","false"])))
+  return result
+
+# --- Messung   --------------------------------------------------------------
+
+def measure(name,func,anzahl):
+  """Laufzeit pro Satz in Mikrosekunden ausgeben"""
+  start = time.perf_counter()
+  result = func()
+  dauer = time.perf_counter() - start
+  print("%-28s %8.2f µs/Satz" % (name,1e6*dauer/anzahl))
+  return result
+
+# --- Hauptprogramm   --------------------------------------------------------
+
+if __name__ == '__main__':
+  anzahl  = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+  records = get_records(anzahl)
+  print("Anzahl Sätze: %d" % anzahl)
+
+  filme = measure("FilmInfo(*liste)",
+                  lambda: [FilmInfo(*r) for r in records],anzahl)
+  rows  = measure("asTuple()",
+                  lambda: [f.asTuple() for f in filme],anzahl)
+  measure("FilmInfo(*row) (DB-Zeile)",
+          lambda: [FilmInfo(*r) for r in rows],anzahl)
+  measure("dauer_as_minutes()",
+          lambda: [f.dauer_as_minutes() for f in filme],anzahl)
+
+  # Speicher der Objekte (ohne die schon vorhandenen Strings der Eingabe)
+  del filme,rows
+  tracemalloc.start()
+  filme = [FilmInfo(*r) for r in records]
+  size,_ = tracemalloc.get_traced_memory()
+  tracemalloc.stop()
+  print("%-28s %8.0f Bytes/Satz" % ("Speicher FilmInfo",size/anzahl))
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# --------------------------------------------------------------------------
+# Mediathekview auf der Kommandozeile
+#
+# Benchmark für die Aktualisierung der Filmliste (-A). Misst die einzelnen
+# Phasen mit synthetischen Filmlisten (tools/gen_filmliste.py).
+#
+# Aufruf: tools/bench_ingest.py -n 100000,500000,2000000
+#
+# Jede Phase läuft in einem eigenen Prozess. MB/s bezieht sich auf die
+# Dateigröße der Filmliste, RSS ist der Spitzenwert inkl. Worker-Prozesse.
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/mtv_cli
+#
+# --------------------------------------------------------------------------
+
+import sys, os, time, lzma, resource, tempfile, configparser
+from argparse import ArgumentParser
+from multiprocessing import Process, Pipe
+
+TOOLS_DIR = os.path.dirname(os.path.realpath(__file__))
+BIN_DIR   = os.path.join(TOOLS_DIR,"..","files","usr","local","bin")
+CONF_FILE = os.path.join(TOOLS_DIR,"..","files","etc","mtv_cli.conf")
+sys.path.insert(0,BIN_DIR)
+
+import mtv_cli
+from mtv_const    import BUFSIZE, INGEST_CHUNK
+from mtv_filmdb   import FilmDB
+from mtv_ingest   import RecordReader, Pipeline, init_worker, parse_chunk
+from mtv_msg      import Msg
+from gen_filmliste import write_filmliste
+
+# --- Hilfsklasse für Optionen   --------------------------------------------
+
+class Options:
+  pass
+
+# --- Eingabe öffnen   ------------------------------------------------------
+
+def open_liste(datei):
+  if datei.endswith(".xz"):
+    return lzma.open(datei,"rt",encoding='utf-8')
+  else:
+    return open(datei,"r",encoding='utf-8')
+
+# --- Phasen   ---------------------------------------------------------------
+
+def phase_lesen(options):
+  """Nur lesen (und ggf. entpacken), Ergebnis sind die entpackten Bytes"""
+  count = 0
+  with open_liste(options.datei) as fpin:
+    while True:
+      buffer = fpin.read(BUFSIZE)
+      if not buffer:
+        return count
+      count += len(buffer.encode())
+
+def phase_tokenizer(options):
+  """Lesen und in Sätze zerlegen"""
+  with open_liste(options.datei) as fpin:
+    return sum(1 for _ in RecordReader(fpin))
+
+def phase_parsen(options):
+  """Lesen, zerlegen, parsen und filtern (ohne Datenbank). Die Blöcke
+     entsprechen denen des Imports (Größe und Startwerte)"""
+  init_worker(options.config)
+  count = 0
+  with open_liste(options.datei) as fpin:
+    pipeline = Pipeline(fpin,FilmDB(options))
+    seed     = None
+    records  = []
+    for record in pipeline.reader:
+      records.append(record)
+      if len(records) == INGEST_CHUNK:
+        count  += len(parse_chunk((records,seed))[1])
+        seed    = pipeline.get_seed(records,seed)
+        records = []
+    count += len(parse_chunk((records,seed))[1])
+  return count
+
+def phase_import(options):
+  """Kompletter Import (wie mtv_cli.py -A)"""
+  options.filmDB = FilmDB(options)
+  with open_liste(options.datei) as fpin:
+    mtv_cli.split_content(fpin,options.filmDB)
+  return options.filmDB.get_count()
+
+PHASEN = [("lesen",phase_lesen),("tokenizer",phase_tokenizer),
+          ("parsen",phase_parsen),("import",phase_import)]
+
+# --- Phase in eigenem Prozess messen   -------------------------------------
+
+def run_phase(func,options,conn):
+  start  = time.perf_counter()
+  count  = func(options)
+  dauer  = time.perf_counter() - start
+  rss    = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+  conn.send((count,dauer,rss))
+  conn.close()
+
+def measure(func,options):
+  """Phase in einem frischen Prozess ausführen (sauberer Peak-RSS)"""
+  parent,child = Pipe()
+  p = Process(target=run_phase,args=(func,options,child))
+  p.start()
+  result = parent.recv()
+  p.join()
+  return result
+
+# --- Kommandozeilenparser   ------------------------------------------------
+
+def get_parser():
+  parser = ArgumentParser(
+    description='Benchmark der Aktualisierung mit synthetischen Filmlisten')
+  parser.add_argument('-n', '--anzahl', default="100000,500000,2000000",
+    help='Anzahl Sätze, kommagetrennt (Default: 100000,500000,2000000)')
+  parser.add_argument('-w', '--worker', type=int, default=0,
+    help='Anzahl Worker beim Import (Default: 0 = alle Kerne)')
+  parser.add_argument('-f', '--format', choices=['json','xz'], default='xz',
+    help='Format der Filmliste (Default: xz)')
+  parser.add_argument('-d', '--dir', default=None,
+    help='Verzeichnis für Testdaten (werden wiederverwendet)')
+  return parser
+
+# --- Hauptprogramm   -------------------------------------------------------
+
+if __name__ == '__main__':
+  args = get_parser().parse_args()
+  Msg.level = "WARN"
+
+  config_parser = configparser.RawConfigParser()
+  config_parser.read(CONF_FILE)
+  config = mtv_cli.get_config(config_parser)
+  config["NUM_WORKERS"] = args.worker
+
+  datadir = args.dir or tempfile.mkdtemp(prefix="mtv_bench_")
+  os.makedirs(datadir,exist_ok=True)
+
+  print("%-10s %-10s %10s %9s %11s %9s %9s" % (
+    "Sätze","Phase","Ergebnis","Zeit [s]","Sätze/s","MB/s","RSS [MB]"))
+  for anzahl in [int(n) for n in args.anzahl.split(",")]:
+    datei = os.path.join(datadir,"Filmliste-%d.%s" % (anzahl,args.format))
+    if not os.path.exists(datei):
+      if args.format == "xz":
+        fp = lzma.open(datei,"wt",encoding='utf-8')
+      else:
+        fp = open(datei,"w",encoding='utf-8')
+      with fp:
+        write_filmliste(fp,anzahl)
+    size = os.path.getsize(datei)
+
+    for name,func in PHASEN:
+      options         = Options()
+      options.config  = config
+      options.datei   = datei
+      options.dbfile  = os.path.join(datadir,"bench.sqlite")
+      if os.path.exists(options.dbfile):
+        os.remove(options.dbfile)
+      count,dauer,rss = measure(func,options)
+      print("%-10d %-10s %10d %9.2f %11.0f %9.2f %9.1f" % (
+        anzahl,name,count,dauer,anzahl/dauer,size/dauer/1e6,rss/1024))
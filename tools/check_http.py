@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# --------------------------------------------------------------------------
+# Mediathekview auf der Kommandozeile
+#
+# Prüfung des internen Downloads (HttpDownload) gegen einen lokalen
+# HTTP-Server: neuer Download, Fortsetzung per Range, schon komplette
+# Datei (416), dauerhafter Fehler (404) und Server ohne Range-Support.
+#
+# Aufruf: tools/check_http.py
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/mtv_cli
+#
+# --------------------------------------------------------------------------
+
+import sys, os, re, tempfile, threading
+import http.server
+
+TOOLS_DIR = os.path.dirname(os.path.realpath(__file__))
+BIN_DIR   = os.path.join(TOOLS_DIR,"..","files","usr","local","bin")
+sys.path.insert(0,BIN_DIR)
+
+from mtv_http     import HttpDownload
+from mtv_msg      import Msg
+
+DATEN = bytes(range(256)) * 4096                  # 1 MB Testdaten
+
+# --- lokaler Server   -------------------------------------------------------
+
+class Handler(http.server.BaseHTTPRequestHandler):
+  """/film liefert DATEN mit Range-Support, /ohne_range ignoriert Range,
+     alles andere ist 404"""
+
+  protocol_version = "HTTP/1.1"
+
+  def log_message(self,*args):
+    pass
+
+  def send_data(self,code,body,headers={}):
+    self.send_response(code)
+    for name,value in headers.items():
+      self.send_header(name,value)
+    self.send_header("Content-Length",str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+  def do_GET(self):
+    if self.path not in ["/film","/ohne_range"]:
+      return self.send_data(404,b"")
+    m = re.match(r"bytes=(\d+)-",self.headers.get("Range",""))
+    if not m or self.path == "/ohne_range":
+      return self.send_data(200,DATEN)
+    start = int(m.group(1))
+    if start >= len(DATEN):
+      return self.send_data(416,b"",
+                            {"Content-Range": "bytes */%d" % len(DATEN)})
+    self.send_data(206,DATEN[start:],{"Content-Range": "bytes %d-%d/%d" %
+                                      (start,len(DATEN)-1,len(DATEN))})
+
+# --- Prüfungen   ------------------------------------------------------------
+
+def check(name,ok):
+  print("%-40s %s" % (name,"OK" if ok else "FEHLER"))
+  return ok
+
+def run_checks(base,tmpdir):
+  loader = HttpDownload(timeout=5,retries=0)
+  ziel   = os.path.join(tmpdir,"film.mp4")
+  inhalt = lambda: open(ziel,"rb").read()
+  ok     = True
+
+  ok &= check("neuer Download",
+              loader.download(base+"/film",ziel) and inhalt() == DATEN)
+
+  with open(ziel,"wb") as fp:
+    fp.write(DATEN[:1000])
+  ok &= check("Fortsetzung per Range (206)",
+              loader.download(base+"/film",ziel) and inhalt() == DATEN)
+
+  ok &= check("Datei schon komplett (416)",
+              loader.download(base+"/film",ziel) and inhalt() == DATEN)
+
+  ok &= check("dauerhafter Fehler (404)",
+              not loader.download(base+"/fehlt",os.path.join(tmpdir,"x")))
+
+  with open(ziel,"wb") as fp:
+    fp.write(b"alt")
+  ok &= check("Server ohne Range-Support (200)",
+              loader.download(base+"/ohne_range",ziel) and inhalt() == DATEN)
+
+  loader.close()
+  return ok
+
+# --- Hauptprogramm   --------------------------------------------------------
+
+if __name__ == '__main__':
+  Msg.level = "ERROR"
+  server = http.server.ThreadingHTTPServer(("127.0.0.1",0),Handler)
+  threading.Thread(target=server.serve_forever,daemon=True).start()
+  base = "http://127.0.0.1:%d" % server.server_address[1]
+  with tempfile.TemporaryDirectory() as tmpdir:
+    ok = run_checks(base,tmpdir)
+  server.shutdown()
+  sys.exit(0 if ok else 1)
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# --------------------------------------------------------------------------
+# Mediathekview auf der Kommandozeile
+#
+# Prüfung der Import-Pipeline (Pipeline.run) mit einer kleinen Filmliste:
+# normaler Import und Abbruch bei einem fehlerhaften Satz, jeweils mit
+# einem und mit mehreren Workern. Ein Abbruch darf nicht hängen bleiben.
+#
+# Aufruf: tools/check_ingest.py
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/mtv_cli
+#
+# --------------------------------------------------------------------------
+
+import sys, os, io, datetime, tempfile, threading, configparser
+
+TOOLS_DIR = os.path.dirname(os.path.realpath(__file__))
+BIN_DIR   = os.path.join(TOOLS_DIR,"..","files","usr","local","bin")
+CONF_FILE = os.path.join(TOOLS_DIR,"..","files","etc","mtv_cli.conf")
+sys.path.insert(0,BIN_DIR)
+
+import mtv_cli
+from mtv_const    import INGEST_CHUNK, INGEST_QUEUE
+from mtv_filmdb   import FilmDB
+from mtv_ingest   import Pipeline
+from mtv_msg      import Msg
+
+ANZAHL  = 4*INGEST_CHUNK*INGEST_QUEUE       # mehr Blöcke als Plätze
+TIMEOUT = 60                                # Sekunden bis "hängt"
+
+# --- Hilfsklasse für Optionen   --------------------------------------------
+
+class Options:
+  pass
+
+# --- Testdaten   ------------------------------------------------------------
+
+def get_liste(kaputt=False):
+  """Filmliste mit ANZAHL Sätzen, optional mit fehlerhaftem erstem Satz"""
+  datum = datetime.date.today().strftime("%d.%m.%Y")
+  satz  = ('"X":["ARD","Thema","Titel %%d","%s","20:00:00","00:30:00",'
+           '"100","Beschreibung","http://example.org/%%d.mp4","","","","",'
+           '"","","","1","","",""]' % datum)
+  saetze = [satz % (i,i) for i in range(ANZAHL)]
+  if kaputt:
+    saetze[0] = '"X":["ARD",kaputt]'
+  return '{"Filmliste":["a","b"],%s}' % ",".join(saetze)
+
+# --- Prüfungen   ------------------------------------------------------------
+
+def check(name,ok):
+  print("%-40s %s" % (name,"OK" if ok else "FEHLER"))
+  return ok
+
+def run_import(config,dbfile,kaputt):
+  """Pipeline in einem Thread ausführen. Ergebnis ist (beendet,Anzahl
+     oder Exception)"""
+
+  options        = Options()
+  options.config = config
+  options.dbfile = dbfile
+  result = [None]
+
+  def target():
+    # die Verbindung des Imports gehört dem Thread, der sie anlegt
+    filmDB = FilmDB(options)
+    filmDB.create_filmtable("voll")
+    try:
+      result[0] = Pipeline(io.StringIO(get_liste(kaputt)),filmDB).run()
+    except Exception as ex:
+      result[0] = ex
+
+  thread = threading.Thread(target=target,daemon=True)
+  thread.start()
+  thread.join(TIMEOUT)
+  return not thread.is_alive(),result[0]
+
+def run_checks(config,tmpdir):
+  ok = True
+  for workers in [1,2]:
+    config["NUM_WORKERS"] = workers
+    dbfile = os.path.join(tmpdir,"filme-%d.sqlite" % workers)
+
+    fertig,result = run_import(config,dbfile,False)
+    ok &= check("Import mit %d Worker(n)" % workers,
+                fertig and result == ANZAHL)
+
+    fertig,result = run_import(config,dbfile+".kaputt",True)
+    ok &= check("Abbruch mit %d Worker(n)" % workers,
+                fertig and isinstance(result,ValueError))
+    if not fertig:
+      # Pool und Threads hängen, ein normales Ende ist nicht möglich
+      print("Import hängt, Abbruch")
+      sys.stdout.flush()
+      os._exit(1)
+  return ok
+
+# --- Hauptprogramm   --------------------------------------------------------
+
+if __name__ == '__main__':
+  Msg.level = "WARN"
+  config_parser = configparser.RawConfigParser()
+  config_parser.read(CONF_FILE)
+  config = mtv_cli.get_config(config_parser)
+  config["DATE_CUTOFF"] = 30
+  with tempfile.TemporaryDirectory() as tmpdir:
+    ok = run_checks(config,tmpdir)
+  sys.exit(0 if ok else 1)
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# --------------------------------------------------------------------------
+# Mediathekview auf der Kommandozeile
+#
+# Synthetische Filmliste für Tests und Benchmarks erzeugen
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/mtv_cli
+#
+# --------------------------------------------------------------------------
+
+import sys, json, lzma, random, datetime
+from argparse import ArgumentParser
+
+HEADER = ["Sender","Thema","Titel","Datum","Zeit","Dauer","Größe [MB]",
+          "Beschreibung","Url","Website","Untertitel","UrlRTMP","Url_Klein",
+          "UrlRTMP_Klein","Url_HD","UrlRTMP_HD","DatumL","Url_History","Geo",
+          "neu"]
+GEO    = ["","","","DE","DE-AT-CH","AT","CH","EU","WELT"]
+WORTE  = ["Dokumentation","über","die","Geschichte","der","Natur","Erde",
+          "Menschen","Tiere","Wissenschaft","Reportage","Leben","Städte",
+          "Flüsse","Berge","\"Zitat\"","Reise","Küste","Nacht","Europa"]
+
+# --- Filmliste schreiben   --------------------------------------------------
+
+def write_filmliste(fp,anzahl,sender=20,themen=2000,tage=40,
+                    dubletten=0.01,beschreibung=400,seed=42):
+  """Filmliste mit anzahl Sätzen in fp (Textmodus) schreiben.
+     Wie im Original sind die Sätze nach Sender und Thema sortiert und
+     wiederholte Werte für Sender und Thema bleiben leer.
+     Gibt die Anzahl geschriebener Sätze (inkl. Dubletten) zurück"""
+
+  rnd   = random.Random(seed)
+  today = datetime.date.today()
+  now   = datetime.datetime.now().strftime("%d.%m.%Y, %H:%M")
+
+  fp.write('{"Filmliste":%s,"Filmliste":%s' % (
+    json.dumps([now,now,"3","MSearch [Vers.: 3.1.139]","0123456789abcdef"]),
+    json.dumps(HEADER,ensure_ascii=False)))
+
+  # Verteilung der Sätze auf Sender und Themen
+  namen   = ["Sender%02d" % i for i in range(sender)]
+  last    = [None,None]
+  count   = 0
+  nummer  = 0
+  while count < anzahl:
+    s     = namen[min(nummer*sender//anzahl,sender-1)]
+    thema = "Thema %d %s" % (rnd.randrange(themen//sender+1),
+                             rnd.choice(WORTE))
+    for _ in range(rnd.randint(1,40)):
+      nummer += 1
+      datum  = today - datetime.timedelta(days=rnd.randrange(tage))
+      dauer  = rnd.choice([0,0,0,1,1,2]),rnd.randrange(60),rnd.randrange(60)
+      text   = " ".join(rnd.choice(WORTE)
+                        for _ in range(rnd.randint(0,beschreibung//6)))
+      url    = "https://cdn%d.%s.example/video/%d/film.mp4" % (
+                 rnd.randrange(4),s.lower(),nummer)
+      satz   = [s,thema,"Folge %d: %s" % (nummer,rnd.choice(WORTE)),
+                datum.strftime("%d.%m.%Y"),
+                "%02d:%02d:00" % (rnd.randrange(24),rnd.randrange(60)),
+                "%02d:%02d:%02d" % dauer,str(rnd.randrange(1,1500)),
+                text[:beschreibung],url,"https://www.%s.example/%d" % (
+                s.lower(),nummer),"","",
+                "%d|klein.mp4" % (len(url)-8),"",
+                "%d|hd.mp4" % (len(url)-8),"",
+                str(int(datetime.datetime.combine(datum,
+                                  datetime.time()).timestamp())),
+                "",rnd.choice(GEO),"false"]
+
+      # wiederholte Werte leer lassen (wie im Original)
+      feld = list(satz)
+      if feld[0] == last[0]:
+        feld[0] = ""
+        if feld[1] == last[1]:
+          feld[1] = ""
+      last = satz[0:2]
+
+      record = json.dumps(feld,ensure_ascii=False)
+      fp.write(',\n"X":' + record)
+      count += 1
+      if rnd.random() < dubletten and count < anzahl:
+        fp.write(',\n"X":' + record)
+        count += 1
+      if count >= anzahl:
+        break
+  fp.write('}')
+  return count
+
+# --- Kommandozeilenparser   ------------------------------------------------
+
+def get_parser():
+  parser = ArgumentParser(
+    description='Synthetische Filmliste erzeugen (JSON oder .xz)')
+  parser.add_argument('-n', '--anzahl', type=int, default=100000,
+    help='Anzahl Sätze (Default: 100000)')
+  parser.add_argument('-s', '--sender', type=int, default=20,
+    help='Anzahl Sender (Default: 20)')
+  parser.add_argument('-t', '--themen', type=int, default=2000,
+    help='Anzahl Themen (Default: 2000)')
+  parser.add_argument('-T', '--tage', type=int, default=40,
+    help='Zeitraum in Tagen (Default: 40)')
+  parser.add_argument('-D', '--dubletten', type=float, default=0.01,
+    help='Anteil doppelter Sätze (Default: 0.01)')
+  parser.add_argument('-B', '--beschreibung', type=int, default=400,
+    help='maximale Länge der Beschreibung (Default: 400)')
+  parser.add_argument('datei', metavar='Datei',
+    help='Ausgabedatei, mit Endung .xz wird komprimiert')
+  return parser
+
+# --- Hauptprogramm   -------------------------------------------------------
+
+if __name__ == '__main__':
+  args = get_parser().parse_args()
+  if args.datei.endswith(".xz"):
+    fp = lzma.open(args.datei,"wt",encoding='utf-8')
+  else:
+    fp = open(args.datei,"w",encoding='utf-8')
+  with fp:
+    count = write_filmliste(fp,args.anzahl,args.sender,args.themen,args.tage,
+                            args.dubletten,args.beschreibung)
+  print("%d Sätze geschrieben: %s" % (count,args.datei),file=sys.stderr)